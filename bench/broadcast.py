@@ -0,0 +1,42 @@
+import time
+
+import vanilla
+import vanilla.message
+
+
+def measure(name, n, f, *a):
+    start = time.time()
+    f(n, *a)
+    print '%-24s %8.2fms' % (name, (time.time() - start) * 1000)
+
+
+def fanout(n, policy):
+    # n items are broadcast to 10 subscribers, one of which only recvs an
+    # item every millisecond
+    h = vanilla.Hub()
+    b = h.broadcast(size=64, policy=policy)
+    done = h.queue(10)
+
+    def subscriber(recver, ms):
+        for item in recver:
+            if ms:
+                h.sleep(ms)
+        done.send(True)
+
+    for i in xrange(10):
+        h.spawn(subscriber, b.subscribe(), i == 0 and 1 or 0)
+    h.sleep(1)
+
+    for i in xrange(n):
+        b.send(i)
+    for sender in b.subscribers[:]:
+        sender.close()
+    print '%-24s %8d' % ('  lag', b.lag)
+
+
+for policy in (
+        vanilla.message.BLOCK,
+        vanilla.message.DROP_OLDEST,
+        vanilla.message.DROP_NEWEST,
+        vanilla.message.DISCONNECT):
+    measure('fanout x1000 %s' % policy, 1000, fanout, policy)
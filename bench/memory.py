@@ -0,0 +1,26 @@
+import gc
+import os
+
+import vanilla
+
+
+def rss():
+    # resident set size in bytes
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+
+def measure(name, n, f):
+    # keeps n results alive and reports the memory each one costs
+    gc.collect()
+    start = rss()
+    keep = [f() for _ in xrange(n)]
+    gc.collect()
+    print '%-20s %8d bytes' % (name, (rss() - start) / len(keep))
+
+
+h = vanilla.Hub()
+
+measure('pipe', 100000, h.pipe)
+measure('state', 100000, h.state)
+measure('stream', 100000, lambda: vanilla.message.Stream(h.pipe().recver))
@@ -0,0 +1,82 @@
+import time
+
+import vanilla
+
+
+def benchmark(name, n, f):
+    start = time.time()
+    for i in xrange(n):
+        f()
+    print '%-20s %8.2f' % (name, n / (time.time() - start))
+
+
+def pingpong(h):
+    # a green thread echoing everything it's sent straight back
+    ping, pong = h.pipe(), h.pipe()
+
+    @h.spawn
+    def _():
+        for item in ping.recver:
+            pong.send(item)
+
+    def f():
+        for i in xrange(1000):
+            ping.send(i)
+            pong.recv()
+    return f
+
+
+def oneway(h):
+    # a green thread draining a pipe, so each send hands straight over
+    p = h.pipe()
+
+    @h.spawn
+    def _():
+        for item in p.recver:
+            pass
+
+    def f():
+        for i in xrange(1000):
+            p.send(i)
+    return f
+
+
+def queue(h):
+    # a green thread draining a queue, which the sender mostly runs ahead of
+    p = h.queue(100)
+
+    @h.spawn
+    def _():
+        for item in p.recver:
+            pass
+
+    def f():
+        for i in xrange(1000):
+            p.send(i)
+    return f
+
+
+def many(h):
+    # as oneway, but moving batches with send_many and recv_many
+    p = h.pipe()
+
+    @h.spawn
+    def _():
+        for items in p.recver.iter_many(100):
+            pass
+
+    def f():
+        p.send_many(xrange(1000))
+    return f
+
+
+h = vanilla.Hub()
+tests = [
+    ('pingpong x1000', pingpong(h)),
+    ('oneway x1000', oneway(h)),
+    ('queue x1000', queue(h)),
+    ('many x1000', many(h)), ]
+
+for _ in xrange(3):
+    for name, f in tests:
+        benchmark(name, 100, f)
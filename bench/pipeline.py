@@ -0,0 +1,30 @@
+import time
+
+import vanilla
+
+
+def measure(name, n, f):
+    start = time.time()
+    f(n)
+    print '%-20s %8.2fms' % (name, (time.time() - start) * 1000)
+
+
+def chain(stages):
+    # n items through a chain of map and filter stages
+    def f(n):
+        h = vanilla.Hub()
+        p = h.pipe()
+        for i in xrange(stages):
+            if i % 2:
+                p = p.filter(lambda x: x >= 0)
+            else:
+                p = p.map(lambda x: x + 1)
+
+        h.spawn(p.send_many, xrange(n))
+        for _ in xrange(n):
+            p.recv()
+    return f
+
+
+for stages in (1, 5, 10):
+    measure('stages x%s' % stages, 10000, chain(stages))
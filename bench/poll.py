@@ -0,0 +1,59 @@
+import os
+import time
+
+import vanilla.poll
+
+
+def benchmark(name, n, f):
+    start = time.time()
+    for i in xrange(n):
+        f()
+    print '%-20s %8.2f' % (name, n / (time.time() - start))
+
+
+def ping(poll):
+    # a batch of pipes each becoming readable and then being drained
+    pipes = [os.pipe() for _ in xrange(100)]
+    for r, w in pipes:
+        poll.register(r, vanilla.poll.POLLIN)
+
+    def f():
+        for r, w in pipes:
+            os.write(w, '1')
+        got = 0
+        while got < len(pipes):
+            for fd, mask in poll.poll():
+                os.read(fd, 4096)
+                got += 1
+    return f
+
+
+def harvest(poll):
+    # as ping, but walking the poller's parallel lists of events
+    pipes = [os.pipe() for _ in xrange(100)]
+    for r, w in pipes:
+        poll.register(r, vanilla.poll.POLLIN)
+
+    def f():
+        for r, w in pipes:
+            os.write(w, '1')
+        got = 0
+        while got < len(pipes):
+            n = poll.harvest()
+            for fd in poll.fds:
+                os.read(fd, 4096)
+            got += n
+    return f
+
+
+polls = []
+for name, backend in vanilla.poll.backends.items():
+    try:
+        polls.append((name, backend()))
+    except OSError, e:
+        print '%-20s %s' % (name, e)
+
+for _ in xrange(3):
+    for name, poll in polls:
+        benchmark('%s ping' % name, 1000, ping(poll))
+        benchmark('%s harvest' % name, 1000, harvest(poll))
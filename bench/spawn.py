@@ -0,0 +1,24 @@
+import time
+
+import vanilla
+
+
+def benchmark(name, n, f):
+    start = time.time()
+    for i in xrange(n):
+        f()
+    print '%-20s %8.2f' % (name, n / (time.time() - start))
+
+
+def churn(h):
+    # spawn a burst of short lived tasks and let them run to completion
+    def f():
+        for i in xrange(1000):
+            h.spawn(lambda: None)
+        h.sleep(0)
+    return f
+
+
+for _ in xrange(3):
+    benchmark("spawn fresh", 100, churn(vanilla.Hub(max_idle=0)))
+    benchmark("spawn pooled", 100, churn(vanilla.Hub()))
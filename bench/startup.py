@@ -0,0 +1,27 @@
+import subprocess
+import sys
+
+
+# each measurement runs in a fresh interpreter, so nothing is already imported
+SNIPPETS = [
+    ('import', 'import vanilla'),
+    ('hub', 'import vanilla; vanilla.Hub()'),
+    ('first io', 'import vanilla; vanilla.Hub().io'),
+    ('first http', 'import vanilla; vanilla.Hub().http'),
+    ('missing x100', 'import vanilla; h = vanilla.Hub()\n'
+        'for i in xrange(100): hasattr(h, "nope")'), ]
+
+
+def measure(code, n=20):
+    timed = (
+        'import time; start = time.time()\n' + code + '\n'
+        'print time.time() - start')
+    best = None
+    for _ in xrange(n):
+        took = float(subprocess.check_output([sys.executable, '-c', timed]))
+        best = best is None and took or min(best, took)
+    return best
+
+
+for name, code in SNIPPETS:
+    print '%-20s %8.2fms' % (name, measure(code) * 1000)
@@ -0,0 +1,32 @@
+import random
+import time
+
+import vanilla.core
+
+
+def benchmark(name, n, f):
+    start = time.time()
+    for i in xrange(n):
+        f()
+    print '%-20s %8.2f' % (name, n / (time.time() - start))
+
+
+def arm_cancel(s):
+    # arm a read timeout per connection and nearly always cancel it
+    def f():
+        for i in xrange(1000):
+            item = s.add(random.randint(1000, 30000), i)
+            if i % 100:
+                s.remove(item)
+    return f
+
+
+heap = vanilla.core.Scheduler()
+wheel = vanilla.core.Wheel()
+
+for _ in xrange(3):
+    benchmark("heap arm/cancel", 100, arm_cancel(heap))
+    benchmark("wheel arm/cancel", 100, arm_cancel(wheel))
+
+print '%-20s %8d' % ("heap entries", len(heap.queue))
+print '%-20s %8d' % ("wheel entries", sum(wheel.counts))
@@ -0,0 +1,53 @@
+import time
+
+import vanilla
+
+
+def measure(name, n, f):
+    start = time.time()
+    f(n)
+    print '%-24s %8.2fms' % (name, (time.time() - start) * 1000)
+
+
+def value(n):
+    # n green threads follow 100 updates to a value
+    h = vanilla.Hub()
+    v = h.value()
+
+    def watcher():
+        for item in v:
+            pass
+
+    for _ in xrange(n):
+        h.spawn(watcher)
+    h.sleep(1)
+    for i in xrange(100):
+        v.send(i)
+        h.sleep(0)
+    v.close()
+    h.sleep(1)
+
+
+def broadcast(n):
+    # the same, with a pipe per follower
+    h = vanilla.Hub()
+    b = h.broadcast()
+
+    def watcher(recver):
+        for item in recver:
+            pass
+
+    for _ in xrange(n):
+        h.spawn(watcher, b.subscribe())
+    h.sleep(1)
+    for i in xrange(100):
+        b.send(i)
+        h.sleep(0)
+    for sender in b.subscribers[:]:
+        sender.close()
+    h.sleep(1)
+
+
+for n in (100, 1000):
+    measure('value x%s' % n, n, value)
+    measure('broadcast x%s' % n, n, broadcast)
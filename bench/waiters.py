@@ -0,0 +1,30 @@
+import time
+
+import vanilla
+
+
+def measure(name, n, f):
+    start = time.time()
+    f(n)
+    print '%-20s %8.2fms' % (name, (time.time() - start) * 1000)
+
+
+def timeouts(n):
+    # n green threads wait on a channel, and time out latest arrival first,
+    # so each timeout removes a waiter from the back of the queue
+    h = vanilla.Hub()
+    ch = h.channel()
+
+    def waiter(ms):
+        try:
+            ch.recv(timeout=ms)
+        except vanilla.Timeout:
+            pass
+
+    for i in xrange(n):
+        h.spawn(waiter, 10 + (n - i) / 100)
+    h.sleep(20 + n / 100)
+
+
+for n in (1000, 10000, 20000):
+    measure('timeouts x%s' % n, n, timeouts)
@@ -1,7 +1,13 @@
+import threading
 import time
+import os
+
+import pytest
 
 import vanilla
+import vanilla.poll
 import vanilla.core
+import vanilla.io
 
 
 def test_lazy():
@@ -42,6 +48,121 @@ def test_Scheduler():
     assert not s
 
 
+def test_Wheel():
+    # the wheel is driven by a fake clock, so nothing depends on how long the
+    # test takes to run
+    now = [100.0]
+    s = vanilla.core.Wheel(clock=lambda: now[0])
+    s.add(4, 'f2')
+    s.add(9, 'f4')
+    s.add(3, 'f1')
+    item3 = s.add(7, 'f3')
+
+    assert abs(s.timeout() - 0.003) < 1e-6
+    assert len(s) == 4
+
+    s.remove(item3)
+    assert len(s) == 3
+    # removal is immediate, not deferred until the item is due
+    assert sum(len(slot) for slot in s.levels[0]) == 3
+
+    got = []
+    for ms in xrange(1, 11):
+        now[0] = 100.0 + ms / 1000.0 - 0.0001
+        # nothing fires early
+        assert not s or s.timeout() > 0
+        now[0] = 100.0 + ms / 1000.0
+        while s and s.timeout() <= 0:
+            got.append((ms, s.pop()))
+    # and everything fires in order, as it comes due
+    assert got == [(3, ('f1', ())), (4, ('f2', ())), (9, ('f4', ()))]
+    assert not s
+
+
+def test_Wheel_cascade():
+    s = vanilla.core.Wheel(bits=2, levels=2)
+    # beyond the first level, the second level and the overflow
+    for ms in [50, 6, 20, 3, 12]:
+        s.add(ms, ms)
+    assert sum(s.counts) == 5
+    assert s.counts[-1] >= 2
+
+    time.sleep(0.03)
+    got = []
+    while s.timeout() < 0:
+        got.append(s.pop()[0])
+    assert got == [3, 6, 12, 20]
+
+    assert s.pop() == (50, ())
+    assert not s
+
+
+def test_Wheel_expire_together():
+    s = vanilla.core.Wheel(resolution=10)
+    for name in 'abc':
+        s.add(5, name)
+    time.sleep(0.02)
+    s.timeout()
+    assert [item.action for item in s.expired] == ['a', 'b', 'c']
+
+
+@pytest.mark.parametrize('scheduler', [
+    vanilla.core.Scheduler, vanilla.core.Wheel])
+def test_slack(scheduler):
+    now = [100.001]
+    s = scheduler(clock=lambda: now[0], slack=50)
+    s.add(3, 'a')
+    s.add(21, 'b')
+    s.add(47, 'c')
+    # a timer can override the default
+    s.arm(5, 0, 'd', ())
+
+    now[0] = 100.04
+    assert s.pop() == ('d', ())
+    # the rest are coalesced on to the end of the window
+    assert 0.01 - s.timeout() < 0.001
+    now[0] = 100.052
+    got = []
+    while s and s.timeout() <= 0:
+        got.append(s.pop()[0])
+    assert got == ['a', 'b', 'c']
+
+
+def test_Registry(monkeypatch):
+    registry = vanilla.core.Registry(['io'])
+    monkeypatch.setattr(vanilla.core, 'plugins', registry)
+
+    discovered = []
+    discover = registry.discover
+    monkeypatch.setattr(
+        registry, 'discover', lambda: discovered.append(1) or discover())
+
+    # vanilla modules are found without scanning for entry points
+    h = vanilla.Hub()
+    assert h.watchdog.hub is h
+    assert discovered == []
+
+    # misses are remembered rather than looked up each time, and entry points
+    # are only scanned for once
+    assert not hasattr(h, 'nope')
+    assert 'nope' in registry.missing
+    assert not hasattr(h, 'nada')
+    assert discovered == [1]
+    pytest.raises(AttributeError, getattr, h, '__nope__')
+
+    class Plugin(object):
+        def __init__(self, hub):
+            self.hub = hub
+
+    registry.register('nope', Plugin)
+    assert h.nope.hub is h
+    assert h.io.hub is h
+    assert registry.factories['io'] is vanilla.io.__plugin__
+
+    h = vanilla.Hub(preload=['nope'])
+    assert 'nope' in h.__dict__
+
+
 class TestHub(object):
     def test_spawn(self):
         h = vanilla.Hub()
@@ -77,3 +198,353 @@ class TestHub(object):
             h.sleep(20)
 
         h.stop()
+
+    def test_scheduler(self):
+        h = vanilla.Hub(scheduler=vanilla.core.Scheduler)
+        assert isinstance(h.scheduled, vanilla.core.Scheduler)
+        a = []
+        h.spawn_later(10, lambda: a.append(1))
+        h.sleep(20)
+        assert a == [1]
+
+    def test_slack(self, monkeypatch):
+        sleeps = []
+        sleep = time.sleep
+        monkeypatch.setattr(
+            time, 'sleep', lambda s: sleeps.append(s) or sleep(s))
+
+        h = vanilla.Hub(slack=20)
+        a = []
+        for ms in xrange(1, 10):
+            h.spawn_later(ms, a.append, ms)
+        h.sleep(30, slack=0)
+        assert a == range(1, 10)
+        # the loop woke for at most two windows of timers, and the sleep
+        assert len(sleeps) <= 3
+
+    def test_now(self):
+        h = vanilla.Hub()
+        h.sleep(1)
+        now = h.now()
+        time.sleep(0.01)
+        # once the loop is running, the clock is only read as it turns
+        assert h.now() == now
+        h.sleep(1)
+        assert h.now() - now >= 0.01
+
+    def test_now_after_poll(self):
+        h = vanilla.Hub()
+        r, w = os.pipe()
+        watch = h.watch(r, vanilla.poll.POLLIN)
+        threading.Timer(0.1, os.write, (w, 'x')).start()
+        # the loop blocks in poll until the write
+        watch.wait(vanilla.poll.POLLIN)
+        start = time.time()
+        h.sleep(50)
+        assert time.time() - start >= 0.045
+        h.unregister(r)
+        os.close(r)
+        os.close(w)
+
+    def test_now_before_loop(self):
+        h = vanilla.Hub()
+        time.sleep(0.05)
+        start = time.time()
+        h.sleep(50)
+        assert time.time() - start >= 0.045
+
+    def test_now_after_work(self):
+        h = vanilla.Hub()
+        h.sleep(1)
+
+        def work(seconds):
+            # holds the loop, as a green thread doing CPU work would
+            start = time.time()
+            while time.time() - start < seconds:
+                pass
+
+        # timers armed late in a long turn last their full duration
+        work(0.1)
+        start = time.time()
+        h.sleep(50)
+        assert time.time() - start >= 0.045
+
+        p = h.pipe()
+        work(0.2)
+        start = time.time()
+        pytest.raises(vanilla.Timeout, p.recv, timeout=100)
+        assert time.time() - start >= 0.095
+
+    def test_coarse(self):
+        h = vanilla.Hub(coarse=True)
+        now = h.now()
+        h.sleep(20)
+        assert h.now() - now >= 0.015
+
+    def test_workers(self):
+        h = vanilla.Hub()
+        a = []
+
+        def raiser():
+            raise Exception()
+
+        h.spawn(a.append, 1)
+        h.sleep(1)
+        assert (h.workers.hits, h.workers.misses) == (0, 1)
+        assert len(h.workers.idle) == 1
+
+        # the parked worker is reused, even after its task raises
+        h.spawn(raiser)
+        h.spawn(a.append, 2)
+        h.sleep(1)
+        assert a == [1, 2]
+        assert (h.workers.hits, h.workers.misses) == (2, 1)
+
+    def test_workers_max_idle(self):
+        h = vanilla.Hub(max_idle=0)
+        for i in xrange(3):
+            h.spawn(lambda: None)
+        h.sleep(1)
+        assert (h.workers.hits, h.workers.misses) == (0, 3)
+        assert not h.workers.idle
+
+    def test_watch(self):
+        h = vanilla.Hub()
+        r, w = os.pipe()
+        watch = h.watch(r, vanilla.poll.POLLIN)
+
+        h.spawn_later(10, os.write, w, 'x')
+        watch.wait(vanilla.poll.POLLIN)
+        assert os.read(r, 1) == 'x'
+
+        pytest.raises(
+            vanilla.exception.Timeout, watch.wait, vanilla.poll.POLLIN, 10)
+
+        h.spawn_later(10, h.unregister, r)
+        pytest.raises(
+            vanilla.exception.Closed, watch.wait, vanilla.poll.POLLIN)
+        os.close(r)
+        os.close(w)
+
+    def test_stats(self):
+        h = vanilla.Hub()
+        h.spawn(lambda: None)
+        h.sleep(1)
+        stats = h.stats()
+        assert stats['iterations'] == 0
+        assert stats['scheduled'] == 0
+
+        h = vanilla.Hub(stats=True)
+        for i in xrange(3):
+            h.spawn(lambda: None)
+        h.sleep(1)
+        stats = h.stats()
+        assert stats['iterations'] > 0
+        assert stats['ready_high'] >= 3
+        assert stats['tasks'] >= 4
+
+        r, w = os.pipe()
+        watch = h.watch(r, vanilla.poll.POLLIN)
+        h.spawn_later(10, os.write, w, 'x')
+        tasks = h.stats()['tasks']
+        watch.wait(vanilla.poll.POLLIN)
+        stats = h.stats()
+        assert stats['registered'] == 1
+        assert stats['polls'] >= 1
+        assert stats['events'] >= 1
+        # the timer, and our wake up, which the loop switched to directly
+        assert stats['tasks'] == tasks + 2
+        h.unregister(r)
+        os.close(r)
+        os.close(w)
+
+    def test_budget(self):
+        h = vanilla.Hub(budget=10, stats=True)
+        r, w = os.pipe()
+        watch = h.watch(r, vanilla.poll.POLLIN)
+        got = []
+
+        def producer(n):
+            # respawns itself forever, which would starve I/O without a budget
+            got.append(n)
+            h.spawn(producer, n + 1)
+
+        h.spawn(producer, 0)
+        os.write(w, 'x')
+        watch.wait(vanilla.poll.POLLIN)
+        assert 0 < len(got) < 20
+        assert h.budget.exhausted > 0
+        assert h.stats()['exhausted'] == h.budget.exhausted
+
+        # overdue timers get to run as well
+        n = len(got)
+        h.sleep(10)
+        assert len(got) > n
+        h.unregister(r)
+        os.close(r)
+        os.close(w)
+
+    def test_budget_ms(self):
+        h = vanilla.Hub(budget_ms=5)
+
+        def hog():
+            time.sleep(0.002)
+            h.spawn(hog)
+
+        h.spawn(hog)
+        h.sleep(1)
+        assert h.budget.exhausted > 0
+
+    def test_priority(self):
+        h = vanilla.Hub()
+        got = []
+        for i in xrange(3):
+            h.spawn(got.append, ('low', i), priority=h.LOW)
+            h.spawn(got.append, ('normal', i))
+            h.spawn(got.append, ('high', i), priority=h.HIGH)
+        h.sleep(1)
+        assert [x for x, i in got] == \
+            ['high'] * 3 + ['normal'] * 3 + ['low'] * 3
+
+        pytest.raises(TypeError, h.spawn, got.append, 1, foo=1)
+
+    def test_priority_sticks(self):
+        h = vanilla.Hub()
+        got = []
+        p = h.pipe()
+
+        @h.spawn
+        def _():
+            got.append(p.recv())
+
+        h.sleep(1)
+        for i in xrange(3):
+            h.spawn(got.append, 'normal')
+
+        def high():
+            # we're requeued as HIGH while the recver runs
+            p.send('sent')
+            got.append('high')
+
+        h.spawn(high, priority=h.HIGH)
+        h.sleep(1)
+        assert got == ['sent', 'high', 'normal', 'normal', 'normal']
+
+    def test_priority_stats(self):
+        h = vanilla.Hub(stats=True)
+        h.spawn(lambda: None, priority=h.HIGH)
+        h.spawn(lambda: None, priority=h.LOW)
+        assert h.stats()['ready'] == 2
+        h.sleep(1)
+        assert h.stats()['ready_high'] >= 2
+
+    def test_priority_starvation(self):
+        h = vanilla.Hub()
+        got = []
+
+        def spin(n):
+            got.append('high')
+            if n:
+                h.spawn(spin, n - 1, priority=h.HIGH)
+
+        h.spawn(spin, 50, priority=h.HIGH)
+        h.spawn(got.append, 'normal')
+        h.spawn(got.append, 'low', priority=h.LOW)
+        h.sleep(1)
+        assert 'normal' in got
+        assert 'low' in got
+        assert got.index('normal') < got.index('low') <= sum(h.weights)
+
+    def test_priority_spawn_later(self):
+        # with a budget of one task a turn, the loop runs overdue timers
+        # between tasks, so the prioritized timers are queued while normal
+        # tasks are still ready
+        h = vanilla.Hub(budget=1)
+        got = []
+
+        def burst():
+            for i in xrange(3):
+                h.spawn(got.append, 'normal')
+
+        # once the loop's running its clock is cached, so the timers are all
+        # due at exactly the same time
+        h.sleep(1)
+        h.spawn_later(5, burst)
+        h.spawn_later(5, got.append, 'low', priority=h.LOW)
+        h.spawn_later(5, got.append, 'high', priority=h.HIGH)
+        h.sleep(20)
+        assert got == ['normal', 'high', 'normal', 'normal', 'low']
+        # prioritized timers are queued as they are, rather than a worker
+        # being used to queue them, so only the six tasks needed workers
+        assert h.workers.hits + h.workers.misses == 6
+
+    def test_priority_spawned_low(self):
+        # a LOW task spawned from a NORMAL one isn't stranded once the normal
+        # ready queue is empty
+        h = vanilla.Hub()
+        p = h.pipe()
+        h.spawn(lambda: h.spawn(p.send, 'low', priority=h.LOW))
+        assert p.recv() == 'low'
+
+        # nor left until a pending timer is due
+        h = vanilla.Hub()
+        p = h.pipe()
+        h.spawn_later(500, lambda: None)
+        start = time.time()
+        h.spawn(lambda: h.spawn(p.send, 'low', priority=h.LOW))
+        assert p.recv() == 'low'
+        assert time.time() - start < 0.4
+
+    def test_priority_watch(self):
+        h = vanilla.Hub()
+        got = h.channel()
+        pipes = [os.pipe() for i in xrange(2)]
+        low = h.watch(pipes[0][0], vanilla.poll.POLLIN, priority=h.LOW)
+        high = h.watch(pipes[1][0], vanilla.poll.POLLIN, priority=h.HIGH)
+        assert h.prioritized == 2
+
+        @h.spawn
+        def _():
+            low.wait(vanilla.poll.POLLIN)
+            got.send('low')
+
+        @h.spawn
+        def _():
+            high.wait(vanilla.poll.POLLIN)
+            got.send('high')
+
+        h.sleep(1)
+        for r, w in pipes:
+            os.write(w, 'x')
+        assert [got.recv(), got.recv()] == ['high', 'low']
+
+        for r, w in pipes:
+            h.unregister(r)
+            os.close(r)
+            os.close(w)
+        assert h.prioritized == 0
+
+    def test_budget_ms_timers(self):
+        h = vanilla.Hub(budget_ms=20)
+        got = []
+
+        def hog():
+            time.sleep(0.005)
+            if not got:
+                h.spawn(hog)
+
+        # the timer comes due part way through the first budgeted turn
+        h.spawn_later(10, got.append, 'timer')
+        h.spawn(hog)
+        h.sleep(30)
+        assert got == ['timer']
+        assert h.budget.exhausted == 1
+
+    def test_monitor(self):
+        h = vanilla.Hub()
+        got = h.channel()
+        h.monitor(10, got.send)
+        stats = got.recv()
+        assert stats['iterations'] > 0
+        assert got.recv()['iterations'] > stats['iterations']
+        h.stop()
@@ -41,6 +41,25 @@ class TestIO(object):
             got += recver.recv()
         assert want == got
 
+    def test_write_interest(self):
+        h = vanilla.Hub()
+        sender, recver = h.io.pipe()
+        fileno = sender.fd.fileno
+        # POLLOUT is only polled while a write is blocked
+        assert h.poll.interest[fileno] == 0
+
+        want = 'x' * 1024 * 1024
+        h.spawn(sender.send, want)
+        h.sleep(1)
+        assert h.poll.interest[fileno] == vanilla.poll.POLLOUT
+
+        got = ''
+        while len(got) < len(want):
+            got += recver.recv()
+        assert want == got
+        h.sleep(1)
+        assert h.poll.interest[fileno] == 0
+
     def test_write_serialize(self):
         h = vanilla.Hub()
         sender, recver = h.io.pipe()
@@ -1,4 +1,5 @@
 import gc
+import time
 
 import pytest
 
@@ -72,6 +73,17 @@ class TestPipe(object):
         p = h.pipe()
         pytest.raises(vanilla.Stop, p.send, 1)
 
+    def test_slots(self):
+        h = vanilla.Hub()
+        sender, recver = h.pipe()
+        pytest.raises(AttributeError, setattr, sender.middle, 'foo', 1)
+        # subclasses share the ends' layout, so they can still be swapped in
+        recver = vanilla.message.Stream(recver)
+        assert recver.extra == ''
+        # and ends still take ad hoc attributes
+        recver.port = 80
+        assert recver.port == 80
+
     def test_close_recver(self):
         h = vanilla.Hub()
 
@@ -92,6 +104,106 @@ class TestPipe(object):
         recver.close()
         assert check.recv() == 'done'
 
+    def test_parked(self):
+        h = vanilla.Hub()
+        sender, recver = h.pipe()
+        done = []
+
+        @h.spawn
+        def _():
+            sender.send(1)
+            done.append(1)
+            sender.send(AssertionError('oops'))
+            done.append(2)
+
+        # the blocked send leaves its item on the pipe, and is only queued to
+        # resume, rather than being switched to, as it's taken
+        h.sleep(1)
+        assert sender.middle.parked == 1
+        assert recver.recv() == 1
+        assert sender.middle.parked is vanilla.message.NoItem
+        assert not done
+        h.sleep(1)
+        assert done == [1]
+
+        pytest.raises(AssertionError, recver.recv)
+        h.sleep(1)
+        assert done == [1, 2]
+
+    def test_parked_close(self):
+        h = vanilla.Hub()
+        sender, recver = h.pipe()
+        check = h.pipe()
+
+        @h.spawn
+        def _():
+            try:
+                sender.send(1)
+            except vanilla.Closed:
+                check.send('closed')
+
+        h.sleep(1)
+        recver.close()
+        assert check.recv() == 'closed'
+        assert sender.middle.parked is vanilla.message.NoItem
+        assert sender.middle.sender_current is None
+
+    def test_send_many(self):
+        h = vanilla.Hub()
+        sender, recver = h.pipe()
+        done = []
+
+        @h.spawn
+        def _():
+            sender.send_many(range(5))
+            done.append(True)
+
+        # the batch is parked on the pipe in one go
+        h.sleep(1)
+        assert recver.recv() == 0
+        assert recver.recv_many(3) == [1, 2, 3]
+        assert not done
+        assert recver.recv_many(3) == [4]
+        h.sleep(1)
+        assert done
+
+    def test_send_many_waiting(self):
+        h = vanilla.Hub()
+        sender, recver = h.pipe()
+        got = h.queue(10)
+
+        @h.spawn
+        def _():
+            for items in recver.iter_many(10):
+                got.send(items)
+
+        # the waiting recver is handed the first item, and takes the rest of
+        # the batch with it
+        h.sleep(1)
+        sender.send_many(range(5))
+        assert got.recv() == range(5)
+
+        recver.close()
+        pytest.raises(vanilla.Closed, sender.send_many, [1, 2])
+
+    def test_send_many_exception(self):
+        h = vanilla.Hub()
+        p = h.pipe()
+        h.spawn(p.send_many, [1, AssertionError('oops'), 2])
+        # items before the exception are returned first
+        assert p.recv_many(10) == [1]
+        pytest.raises(AssertionError, p.recv_many, 10)
+        assert p.recv_many(10) == [2]
+
+    def test_consume_many(self):
+        h = vanilla.Hub()
+        p = h.pipe()
+        got = h.queue(10)
+        p.recver.consume_many(got.send, 3)
+        h.spawn(p.send_many, range(5))
+        assert got.recv() == [0, 1, 2]
+        assert got.recv() == [3, 4]
+
     def test_close_sender(self):
         h = vanilla.Hub()
 
@@ -227,6 +339,101 @@ class TestPipe(object):
         assert item == 10
         assert check.recv() == 'done'
 
+    def test_selector(self):
+        h = vanilla.Hub()
+
+        s1, r1 = h.pipe()
+        s2, r2 = h.pipe()
+        check = h.pipe()
+
+        selector = h.selector([s1, r2])
+        assert len(selector) == 2
+        assert s1.middle.sender_current is not None
+
+        @h.spawn
+        def _():
+            check.send(r1.recv())
+
+        @h.spawn
+        def _():
+            s2.send(10)
+            check.send('done')
+
+        ch, item = selector.wait()
+        assert ch == s1
+        s1.send(20)
+
+        ch, item = selector.wait()
+        assert ch == r2
+        assert item == 10
+
+        assert check.recv() == 20
+        assert check.recv() == 'done'
+
+        pytest.raises(vanilla.Timeout, selector.wait, timeout=0)
+
+        # registrations persist between waits, and are lifted on remove
+        h.spawn(s2.send, 30)
+        assert selector.wait() == (r2, 30)
+        selector.remove(s1)
+        assert s1 not in selector
+        assert s1.middle.sender_current is None
+        h.spawn(s1.middle.recver().recv)
+        pytest.raises(vanilla.Timeout, selector.wait, timeout=10)
+
+    def test_selector_ready(self):
+        h = vanilla.Hub()
+
+        pipes = [h.pipe() for _ in xrange(3)]
+        selector = h.selector(recver for _, recver in pipes)
+
+        def send(sender, i):
+            sender.send(i)
+            sender.send(i)
+
+        for i, (sender, _) in enumerate(pipes):
+            h.spawn(send, sender, i)
+        h.sleep(1)
+
+        # with every end ready, each is reported in turn
+        got = [selector.wait()[1] for _ in xrange(6)]
+        assert got == [0, 1, 2, 0, 1, 2]
+
+    def test_selector_dealer(self):
+        h = vanilla.Hub()
+
+        s1, r1 = h.pipe()
+        d = h.dealer()
+        selector = h.selector([r1, d.recver])
+
+        h.spawn(d.send, 1)
+        assert selector.wait() == (d.recver, 1)
+        assert not d.recver.current
+
+        @h.spawn
+        def _():
+            h.sleep(5)
+            d.send(2)
+
+        assert selector.wait() == (d.recver, 2)
+        assert not d.recver.current
+
+    def test_selector_close(self):
+        h = vanilla.Hub()
+
+        s1, r1 = h.pipe()
+        selector = h.selector([r1])
+
+        @h.spawn
+        def _():
+            h.sleep(5)
+            s1.close()
+
+        pytest.raises(vanilla.Closed, selector.wait)
+        pytest.raises(vanilla.Closed, selector.wait)
+        selector.remove(r1)
+        assert len(selector) == 0
+
     def test_pipe(self):
         h = vanilla.Hub()
 
@@ -310,6 +517,91 @@ class TestPipe(object):
         h.spawn(p.send, 'foo')
         assert p.recv() == 'foofoo.'
 
+    def test_filter(self):
+        h = vanilla.Hub()
+        p = h.pipe().filter(lambda x: x % 2)
+        h.spawn(p.send_many, range(5))
+        assert p.recv() == 1
+        assert p.recv() == 3
+
+    def test_fuse(self):
+        h = vanilla.Hub()
+        p = h.pipe()
+        p2 = p.map(lambda x: x + 1)
+        p3 = p2.map(lambda x: x * 2).filter(lambda x: x % 3).map(str)
+        # the run of stages shares a single green thread and pipe
+        assert len(p3.recver.stages) == 4
+        assert p2.recver.stages is None
+
+        h.spawn(p.send_many, range(4))
+        assert p3.recv() == '2'
+        assert p3.recv() == '4'
+        assert p3.recv() == '8'
+
+    def test_fuse_alias(self):
+        h = vanilla.Hub()
+        sender, r1 = h.pipe()
+        r2 = r1.map(lambda x: x + 1)
+        r3 = r2.map(lambda x: x * 2)
+        # each stage returns its own Recver, even when the run is fused
+        assert r3 is not r2
+        assert r3.stages is not None and len(r3.stages) == 2
+        # r2 is spent, rather than handing out items mapped by r3's stage
+        pytest.raises(AttributeError, r2.recv, timeout=0)
+
+        r4 = r3.filter(lambda x: x > 2)
+        assert r4 is not r3
+        h.spawn(sender.send_many, range(3))
+        assert r4.recv() == 4
+        assert r4.recv() == 6
+
+        # the spent Recvers going away doesn't abandon the run
+        del r2, r3
+        gc.collect()
+        h.spawn(sender.send, 5)
+        assert r4.recv() == 12
+
+    def test_fuse_raises(self):
+        h = vanilla.Hub()
+
+        class E(Exception):
+            pass
+
+        def f(x):
+            if x == 1:
+                raise E()
+            return x
+
+        p = h.pipe().map(f).map(lambda x: x * 2)
+        h.spawn(p.send_many, range(3))
+        assert p.recv() == 0
+        # the exception skips the rest of the run
+        pytest.raises(E, p.recv)
+        assert p.recv() == 4
+
+    def test_fuse_split(self):
+        h = vanilla.Hub()
+        p = h.pipe().map(lambda x: x + 1)
+        h.spawn(p.send, 1)
+        h.sleep(1)
+        # the run is blocked sending 2, so the next stage can't join it
+        p2 = p.map(lambda x: x * 10)
+        assert p2.recver is not p.recver
+        assert p2.recv() == 20
+        h.spawn(p2.send, 2)
+        assert p2.recv() == 30
+
+    def test_fuse_close(self):
+        h = vanilla.Hub()
+        sender, recver = h.pipe()
+        recver = recver.map(lambda x: x + 1).filter(bool)
+        h.spawn(sender.send, 1)
+        assert recver.recv() == 2
+        # closing the end of the run halts it once it next sends
+        recver.close()
+        sender.send(2)
+        pytest.raises(vanilla.Timeout, sender.send, 3, timeout=10)
+
     def test_consume(self):
         h = vanilla.Hub()
         p = h.pipe()
@@ -408,10 +700,106 @@ class TestQueue(object):
         gc.collect()
         h.sleep(1)
 
+    def test_queue_native(self):
+        h = vanilla.Hub()
+        sender, recver = h.queue(2)
+        # there's no green thread moving items between the ends
+        assert sender.middle is recver.middle
+        assert not any(h.queues)
+
+        sender.send(1)
+        sender.send(AssertionError('oops'))
+        assert recver.recv() == 1
+        pytest.raises(AssertionError, recver.recv)
+
+    def test_queue_close(self):
+        h = vanilla.Hub()
+        sender, recver = h.queue(2)
+        sender.send(1)
+        sender.send(2)
+        sender.close()
+        # buffered items are still delivered
+        assert recver.recv() == 1
+        assert recver.recv() == 2
+        pytest.raises(vanilla.Closed, recver.recv)
+
+        sender, recver = h.queue(1)
+        check = h.pipe()
+
+        @h.spawn
+        def _():
+            try:
+                for i in xrange(3):
+                    sender.send(i)
+            except vanilla.Closed:
+                check.send('closed')
+
+        h.sleep(1)
+        recver.close()
+        assert check.recv() == 'closed'
+
+    def test_queue_blocked(self):
+        h = vanilla.Hub()
+        sender, recver = h.queue(2)
+
+        @h.spawn
+        def _():
+            for i in xrange(5):
+                sender.send(i)
+            sender.close()
+
+        # the sender blocks while the queue's full, and is resumed as room is
+        # made
+        assert list(recver) == range(5)
+
+    def test_queue_many(self):
+        h = vanilla.Hub()
+        sender, recver = h.queue(3)
+        done = []
+
+        @h.spawn
+        def _():
+            sender.send_many(range(8))
+            done.append(True)
+
+        # the buffer is filled, and the rest of the batch is parked
+        h.sleep(1)
+        assert recver.recv_many(2) == [0, 1]
+        assert recver.recv_many(10) == [2, 3, 4, 5, 6, 7]
+        h.sleep(1)
+        assert done
+
+        sender.send_many([8, 9])
+        assert recver.recv_many(10) == [8, 9]
+
+    def test_queue_pipe(self):
+        h = vanilla.Hub()
+        p = h.pipe()
+        recver = p.pipe(h.queue(2))
+        h.spawn(p.send, 1)
+        assert recver.recv() == 1
+        p.close()
+        pytest.raises(vanilla.Closed, recver.recv)
+
 
 class TestPulse(object):
-    def test_pulse(self):
+    @pytest.fixture
+    def hub(self, monkeypatch):
+        # a Hub on a virtual clock, which only moves when the loop sleeps
+        # until its next timer. with nothing registered the loop never polls,
+        # so the ticks seen don't depend on how quickly the test runs
         h = vanilla.Hub()
+        now = [h.time]
+
+        def sleep(seconds):
+            now[0] += max(seconds, 1e-6)
+
+        h.clock = lambda: now[0]
+        monkeypatch.setattr(time, 'sleep', sleep)
+        return h
+
+    def test_pulse(self, hub):
+        h = hub
 
         trigger = h.pulse(20)
         pytest.raises(vanilla.Timeout, trigger.recv, timeout=0)
@@ -424,8 +812,72 @@ class TestPulse(object):
         assert trigger.recv(timeout=0)
         pytest.raises(vanilla.Timeout, trigger.recv, timeout=0)
 
+        # a waiting consumer is handed ticks by the loop, without a worker
+        workers = h.workers.hits + h.workers.misses
+        for _ in xrange(3):
+            assert trigger.recv()
+        assert h.workers.hits + h.workers.misses == workers
+
         h.stop()
 
+    def test_pulse_no_drift(self, hub):
+        h = hub
+        trigger = h.pulse(20)
+        start = h.now()
+        for i in xrange(5):
+            trigger.recv()
+            h.sleep(8)
+        # the consumer's latency isn't added to the period, which would take
+        # at least 140ms
+        assert h.now() - start < 0.11
+
+    def test_pulse_catchup(self, hub):
+        h = hub
+
+        trigger = h.pulse(20, policy='catchup')
+        h.sleep(50)
+        for _ in xrange(2):
+            assert trigger.recv(timeout=0)
+        pytest.raises(vanilla.Timeout, trigger.recv, timeout=0)
+
+        trigger = h.pulse(10)
+        h.sleep(35)
+        assert trigger.recv(timeout=0)
+        pytest.raises(vanilla.Timeout, trigger.recv, timeout=0)
+
+        pytest.raises(ValueError, h.pulse, 10, policy='nope')
+
+    def test_pulse_close(self, hub):
+        h = hub
+        trigger = h.pulse(10)
+        h.sleep(15)
+        trigger.close()
+        # the timer is cancelled, rather than left to come due
+        assert not h.scheduled
+
+
+def test_waiters():
+    waiters = vanilla.message.Waiters()
+    for i in xrange(100):
+        waiters.append(i)
+    # removal is lazy, but the removed don't show up, and order is kept
+    for i in xrange(100):
+        if i % 10:
+            waiters.remove(i)
+    assert len(waiters) == 10
+    assert 0 in waiters and 1 not in waiters
+    assert list(waiters) == range(0, 100, 10)
+    # stale entries are compacted away
+    assert len(waiters.queue) < 100
+    assert waiters.first() == 0
+    waiters.remove(0)
+    assert waiters.first() == 10
+    # a waiter which comes back goes to the back of the queue
+    waiters.remove(10)
+    waiters.append(10)
+    assert waiters.first() == 20
+    assert list(waiters)[-1] == 10
+
 
 class TestDealer(object):
     def test_send_then_recv(self):
@@ -603,6 +1055,27 @@ class TestChannel(object):
         assert q.recv() == 2
         assert q.recv() == 3
 
+    def test_timeouts(self):
+        h = vanilla.Hub()
+        ch = h.channel()
+        out = h.queue(10)
+
+        def recv(i, timeout):
+            try:
+                out.send((i, ch.recv(timeout=timeout)))
+            except vanilla.Timeout:
+                pass
+
+        for i in xrange(6):
+            h.spawn(recv, i, 10 if i % 2 else -1)
+        h.sleep(20)
+        # the waiters which timed out are skipped, and the rest are still
+        # served in the order they arrived
+        assert len(ch.recver.current) == 3
+        for i in xrange(3):
+            h.spawn(ch.send, i)
+        assert [out.recv() for _ in xrange(3)] == [(0, 0), (2, 1), (4, 2)]
+
     def test_no_queue(self):
         h = vanilla.Hub()
         ch = h.channel()
@@ -619,6 +1092,15 @@ class TestChannel(object):
         assert ch.recv() == 2
         assert ch.recv() == 3
 
+    def test_many(self):
+        h = vanilla.Hub()
+        ch = h.channel(2)
+        h.spawn(ch.send_many, range(5))
+        got = []
+        while len(got) < 5:
+            got.extend(ch.recv_many(10))
+        assert got == range(5)
+
 
 class TestBroadcast(object):
     def test_broadcast(self):
@@ -677,6 +1159,59 @@ class TestBroadcast(object):
         assert check.recv() == ('s1', True)
         assert check.recv() == ('s2', True)
 
+    def test_drop(self):
+        h = vanilla.Hub()
+        b = h.broadcast(size=2, policy=vanilla.message.DROP_OLDEST)
+        oldest = b.subscribe()
+        newest = b.subscribe(policy=vanilla.message.DROP_NEWEST)
+        waiting = b.subscribe()
+        got = h.queue(10)
+
+        @h.spawn
+        def _():
+            for item in waiting:
+                got.send(item)
+        h.sleep(1)
+
+        # none of the sends block, even though nothing recvs on two of the
+        # subscribers
+        for i in xrange(5):
+            b.send(i)
+        assert oldest.recv_many(10) == [3, 4]
+        assert oldest.lag == 3
+        assert newest.recv_many(10) == [0, 1]
+        assert newest.lag == 3
+        h.sleep(1)
+        assert [got.recv() for i in xrange(5)] == range(5)
+        assert waiting.lag == 0
+        assert b.lag == 6
+
+    def test_disconnect(self):
+        h = vanilla.Hub()
+        b = h.broadcast()
+        fine = b.subscribe(size=10, policy=vanilla.message.DISCONNECT)
+        slow = b.subscribe(size=2, policy=vanilla.message.DISCONNECT)
+
+        for i in xrange(3):
+            b.send(i)
+        assert b.subscribers == [fine.other]
+        assert slow.lag == 1
+        # what was buffered can still be received
+        assert slow.recv_many(10) == [0, 1]
+        pytest.raises(vanilla.Closed, slow.recv)
+        assert fine.recv_many(10) == [0, 1, 2]
+
+    def test_abandoned(self):
+        h = vanilla.Hub()
+        b = h.broadcast(size=1, policy=vanilla.message.DROP_NEWEST)
+        b.onempty(lambda: None)
+        s = b.subscribe()
+        del s
+        gc.collect()
+        h.sleep(1)
+        b.send(1)
+        assert not b.subscribers
+
 
 class TestState(object):
     def test_state(self):
@@ -713,6 +1248,96 @@ class TestState(object):
         # TODO: should clear be able to be passed through map?
 
 
+class TestValue(object):
+    def test_value(self):
+        h = vanilla.Hub()
+        v = h.value()
+        pytest.raises(vanilla.Timeout, v.recv, timeout=10)
+        h.spawn_later(10, v.send, 'a')
+        assert v.recv() == 'a'
+        assert v.recv() == 'a'
+        assert v.watch(0) == (1, 'a')
+        pytest.raises(vanilla.Timeout, v.watch, 1, timeout=10)
+        assert not v.waiters
+
+        v = h.value('b')
+        assert v.watch(0) == (1, 'b')
+
+    def test_fanout(self):
+        h = vanilla.Hub()
+        v = h.value()
+        out = h.queue(10)
+
+        def watch(name):
+            out.send((name, v.watch(0)))
+
+        for name in 'abc':
+            h.spawn(watch, name)
+        h.sleep(1)
+        assert len(v.waiters) == 3
+
+        # the send queues every waiter, without switching to any of them
+        v.send(1)
+        assert not v.waiters
+        assert not out.recver.ready
+        h.sleep(1)
+        assert [out.recv() for _ in xrange(3)] == [
+            ('a', (1, 1)), ('b', (1, 1)), ('c', (1, 1))]
+
+    def test_iter(self):
+        h = vanilla.Hub()
+        v = h.value()
+        got = h.queue(10)
+
+        @h.spawn
+        def _():
+            for item in v:
+                got.send(item)
+                h.sleep(10)
+            got.send('done')
+
+        v.send(1)
+        h.sleep(5)
+        # sends made while the watcher is busy are skipped to the latest
+        v.send(2)
+        v.send(3)
+        h.sleep(10)
+        assert [got.recv(), got.recv()] == [1, 3]
+        # but the latest version isn't seen twice
+        pytest.raises(vanilla.Timeout, got.recv, timeout=20)
+
+        v.close()
+        assert got.recv() == 'done'
+        pytest.raises(vanilla.Closed, v.send, 4)
+        pytest.raises(vanilla.Closed, v.watch, 3)
+        assert v.watch(2) == (3, 3)
+
+    def test_timeout_after_wake(self):
+        # with a budget of one task a turn, overdue timers run before the
+        # rest of the ready queue
+        h = vanilla.Hub(budget=1)
+        v = h.value()
+        out = h.queue(10)
+
+        @h.spawn
+        def _():
+            out.send(v.recv(timeout=10))
+            p = h.pipe()
+            try:
+                p.recv(timeout=20)
+            except vanilla.Timeout:
+                out.send('timeout')
+
+        h.sleep(1)
+        time.sleep(0.02)
+        h.spawn(lambda: None)
+        # the waiter is queued to be woken, but its timeout fires first
+        v.send(1)
+        assert out.recv() == 1
+        # and it isn't resumed a second time while it next blocks
+        assert out.recv(timeout=100) == 'timeout'
+
+
 class TestSerialize(object):
     def test_serialize(self):
         h = vanilla.Hub()
@@ -733,10 +1358,17 @@ class TestSerialize(object):
         h = vanilla.Hub()
 
         @h.serialize
-        def go():
-            raise AssertionError('foo')
-
-        pytest.raises(AssertionError, go)
+        def go(fail):
+            if fail:
+                raise AssertionError('foo')
+            return 'ok'
+
+        e = pytest.raises(AssertionError, go, True)
+        # the exception is raised straight from the call, on our green thread
+        assert e.traceback[-1].name == 'go'
+        # and the lock is released for the next call
+        assert go(False) == 'ok'
+        pytest.raises(AssertionError, go, True)
 
 
 class TestStream(object):
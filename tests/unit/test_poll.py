@@ -1,12 +1,31 @@
+import signal
 import os
 
+import pytest
+
+import vanilla
 import vanilla.poll
 
 
-class TestPoll(object):
-    def test_poll(self):
-        poll = vanilla.poll.Poll()
+@pytest.fixture(params=vanilla.poll.backends.keys())
+def poll(request):
+    try:
+        return vanilla.poll.backends[request.param]()
+    except OSError, e:
+        pytest.skip('%s unavailable: %s' % (request.param, e))
+
+
+def close(poll, fd):
+    # as the Hub does: close and then unregister
+    os.close(fd)
+    try:
+        poll.unregister(fd)
+    except (IOError, OSError):
+        pass
 
+
+class TestPoll(object):
+    def test_poll(self, poll):
         r, w = os.pipe()
 
         poll.register(r, vanilla.poll.POLLIN)
@@ -14,46 +33,202 @@ class TestPoll(object):
 
         os.write(w, '1')
         assert poll.poll() == [(r, vanilla.poll.POLLIN)]
-        # test event is cleared
-        assert poll.poll(timeout=0) == []
+        if poll.edge:
+            # test event is cleared
+            assert poll.poll(timeout=0) == []
+        else:
+            # test event remains while there's data to read
+            assert poll.poll(timeout=0) == [(r, vanilla.poll.POLLIN)]
 
         # test event is reset on new write after read
         assert os.read(r, 4096) == '1'
         assert poll.poll(timeout=0) == []
         os.write(w, '2')
         assert poll.poll() == [(r, vanilla.poll.POLLIN)]
-        assert poll.poll(timeout=0) == []
 
-        # test event is reset on new write without read
-        os.write(w, '3')
-        assert poll.poll() == [(r, vanilla.poll.POLLIN)]
-        assert poll.poll(timeout=0) == []
+        if poll.edge:
+            assert poll.poll(timeout=0) == []
+            # test event is reset on new write without read
+            os.write(w, '3')
+            assert poll.poll() == [(r, vanilla.poll.POLLIN)]
+            assert poll.poll(timeout=0) == []
+        else:
+            os.write(w, '3')
 
         assert os.read(r, 4096) == '23'
 
-    def test_write_close(self):
-        poll = vanilla.poll.Poll()
+    def test_timeout(self, poll):
+        r, w = os.pipe()
+        poll.register(r, vanilla.poll.POLLIN)
+        assert poll.poll(timeout=0.01) == []
+
+    def test_signal(self, poll):
+        # a signal arriving while the poll blocks interrupts it, which is
+        # reported as no events rather than raised
+        r, w = os.pipe()
+        poll.register(r, vanilla.poll.POLLIN)
+        caught = []
+        previous = signal.signal(signal.SIGALRM, lambda *a: caught.append(a))
+        try:
+            signal.setitimer(signal.ITIMER_REAL, 0.01)
+            assert poll.poll(timeout=0.5) == []
+        finally:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, previous)
+        assert caught
+        close(poll, r)
+        os.close(w)
+
+    def test_write_close(self, poll):
         r, w = os.pipe()
 
         poll.register(r, vanilla.poll.POLLIN)
         poll.register(w, vanilla.poll.POLLOUT)
         assert poll.poll() == [(w, vanilla.poll.POLLOUT)]
-        assert poll.poll(timeout=0) == []
+        if poll.edge:
+            assert poll.poll(timeout=0) == []
 
-        os.close(w)
+        close(poll, w)
         assert poll.poll() == [(r, vanilla.poll.POLLERR)]
-        assert poll.poll(timeout=0) == []
+        if poll.edge:
+            assert poll.poll(timeout=0) == []
 
-    def test_read_close(self):
-        poll = vanilla.poll.Poll()
+    def test_read_close(self, poll):
         r, w = os.pipe()
 
         poll.register(r, vanilla.poll.POLLIN)
         poll.register(w, vanilla.poll.POLLOUT)
         assert poll.poll() == [(w, vanilla.poll.POLLOUT)]
-        assert poll.poll(timeout=0) == []
+        if poll.edge:
+            assert poll.poll(timeout=0) == []
 
-        os.close(r)
+        close(poll, r)
         got = poll.poll()
         assert got == [(w, vanilla.poll.POLLOUT), (w, vanilla.poll.POLLERR)]
+        if poll.edge:
+            assert poll.poll(timeout=0) == []
+
+    def test_unregister(self, poll):
+        r, w = os.pipe()
+        poll.register(r, vanilla.poll.POLLIN)
+        poll.unregister(r, vanilla.poll.POLLIN)
+        os.write(w, '1')
+        assert poll.poll(timeout=0) == []
+
+    def test_modify(self, poll):
+        r, w = os.pipe()
+        poll.register(w)
+        assert poll.poll(timeout=0) == []
+
+        poll.modify(w, vanilla.poll.POLLOUT)
+        assert poll.poll() == [(w, vanilla.poll.POLLOUT)]
+        poll.modify(w)
         assert poll.poll(timeout=0) == []
+
+        pytest.raises(IOError, poll.modify, r)
+
+    def test_modify_unchanged(self, poll):
+        r, w = os.pipe()
+        changes = []
+        change = poll.change
+        poll.change = lambda *a: changes.append(a) or change(*a)
+
+        poll.register(r, vanilla.poll.POLLIN)
+        poll.modify(r, vanilla.poll.POLLIN)
+        assert changes == []
+        poll.modify(r, vanilla.poll.POLLIN, vanilla.poll.POLLOUT)
+        assert len(changes) == 1
+
+    def test_oneshot(self, poll):
+        r, w = os.pipe()
+        poll.register(r, vanilla.poll.POLLIN, oneshot=True)
+
+        os.write(w, '1')
+        assert poll.poll() == [(r, vanilla.poll.POLLIN)]
+        # disarmed until it's rearmed, even for level triggered backends
+        os.write(w, '2')
+        assert poll.poll(timeout=0) == []
+
+        poll.modify(r, vanilla.poll.POLLIN)
+        assert poll.poll() == [(r, vanilla.poll.POLLIN)]
+        assert os.read(r, 4096) == '12'
+        poll.unregister(r)
+
+    def test_harvest(self, poll):
+        pipes = [os.pipe() for _ in xrange(3)]
+        for r, w in pipes:
+            poll.register(r, vanilla.poll.POLLIN)
+            os.write(w, '1')
+
+        fds, masks = poll.fds, poll.masks
+        poll.maxevents = 2
+        if isinstance(poll, vanilla.poll.SelectPoll):
+            # select.poll always returns every ready descriptor
+            assert poll.harvest() == 3
+            got = list(fds)
+        else:
+            assert poll.harvest() == 2
+            got = list(fds)
+            # the rest are reported on the next harvest, along with those
+            # which are still ready for level triggered backends
+            assert poll.harvest() == (poll.edge and 1 or 2)
+            got.extend(fd for fd in fds if fd not in got)
+        assert sorted(got) == sorted(r for r, w in pipes)
+        assert masks == [vanilla.poll.POLLIN] * len(fds)
+        # the lists are reused
+        assert poll.fds is fds and poll.masks is masks
+
+
+@pytest.mark.parametrize('name', vanilla.poll.backends.keys())
+def test_hub(name):
+    try:
+        h = vanilla.Hub(poller=vanilla.poll.backends[name])
+    except OSError, e:
+        pytest.skip('%s unavailable: %s' % (name, e))
+    sender, recver = h.io.pipe()
+    sender.send('1')
+    assert recver.recv() == '1'
+    h.spawn_later(10, sender.send, '2')
+    assert recver.recv() == '2'
+
+
+def test_hub_maxevents():
+    h = vanilla.Hub(maxevents=1)
+    pipes = [h.io.pipe() for _ in xrange(3)]
+    for sender, recver in pipes:
+        sender.send('1')
+    assert [recver.recv() for sender, recver in pipes] == ['1'] * 3
+
+
+@pytest.mark.parametrize('name', vanilla.poll.backends.keys())
+def test_hub_idle_ready(name):
+    try:
+        h = vanilla.Hub(poller=vanilla.poll.backends[name])
+    except OSError, e:
+        pytest.skip('%s unavailable: %s' % (name, e))
+    r, w = os.pipe()
+    watch = h.watch(r, vanilla.poll.POLLIN)
+    os.write(w, 'x')
+    watch.wait(vanilla.poll.POLLIN)
+
+    harvests = []
+    harvest = h.poll.harvest
+
+    def counted(timeout=-1):
+        harvests.append(timeout)
+        return harvest(timeout)
+
+    h.poll.harvest = counted
+    # r stays readable with no one waiting on it, which mustn't keep the
+    # loop from blocking until the sleep is due
+    h.sleep(20)
+    assert len(harvests) < 5
+
+    if not h.poll.edge:
+        # and waiting on it again rearms it
+        watch.wait(vanilla.poll.POLLIN, timeout=100)
+    assert os.read(r, 1) == 'x'
+
+    h.unregister(r)
+    os.close(r)
+    os.close(w)
@@ -0,0 +1,312 @@
+import gc
+
+import pytest
+
+import vanilla
+
+
+def test_lock():
+    h = vanilla.Hub()
+    lock = h.lock()
+    out = h.queue(10)
+
+    def go(i):
+        with lock:
+            out.send(('in', i))
+            h.sleep(10)
+            out.send(('out', i))
+
+    for i in xrange(3):
+        h.spawn(go, i)
+
+    got = [out.recv() for _ in xrange(6)]
+    # waiters acquire in the order they arrived, one at a time
+    assert got == [
+        ('in', 0), ('out', 0), ('in', 1), ('out', 1), ('in', 2), ('out', 2)]
+    h.sleep(1)
+    assert not lock.locked()
+    pytest.raises(RuntimeError, lock.release)
+
+
+def test_lock_timeout():
+    h = vanilla.Hub()
+    lock = h.lock()
+    lock.acquire()
+    pytest.raises(vanilla.Timeout, lock.acquire, timeout=10)
+    assert not lock.waiters
+    lock.release()
+    assert lock.acquire(timeout=0)
+
+
+def test_semaphore():
+    h = vanilla.Hub()
+    s = h.semaphore(2)
+    held = []
+    high = []
+
+    def go():
+        with s:
+            held.append(1)
+            high.append(len(held))
+            h.sleep(10)
+            held.pop()
+
+    for _ in xrange(5):
+        h.spawn(go)
+    h.sleep(50)
+    assert max(high) == 2
+    assert s.value == 2
+
+
+def test_event():
+    h = vanilla.Hub()
+    e = h.event()
+    out = h.queue(10)
+
+    for i in xrange(3):
+        h.spawn(lambda i: out.send(e.wait() and i), i)
+
+    pytest.raises(vanilla.Timeout, e.wait, timeout=10)
+    h.spawn_later(10, e.set)
+    assert e.wait()
+    assert [out.recv() for _ in xrange(3)] == [0, 1, 2]
+    assert e.is_set()
+    e.clear()
+    pytest.raises(vanilla.Timeout, e.wait, timeout=0)
+
+
+def test_event_wake():
+    h = vanilla.Hub()
+    e = h.event()
+    got = []
+
+    for i in xrange(3):
+        h.spawn(lambda i: e.wait() and got.append(i), i)
+    h.sleep(1)
+
+    # set queues the waiters, rather than switching to each in turn
+    e.set()
+    assert got == []
+    h.sleep(1)
+    assert got == [0, 1, 2]
+    assert not e.waiters
+
+    # a waiter woken just as it times out still returns
+    e.clear()
+    h.spawn(lambda: got.append(e.wait(timeout=10)))
+    h.sleep(1)
+    waiter, = e.waiters
+    e.set()
+    h.throw_to(waiter, vanilla.Timeout('timeout'))
+    h.sleep(1)
+    assert got[3:] == [True]
+
+
+def test_condition():
+    h = vanilla.Hub()
+    c = h.condition()
+    items = []
+    out = h.queue(10)
+
+    def consumer():
+        with c:
+            while not items:
+                c.wait()
+            out.send(items.pop(0))
+
+    for _ in xrange(2):
+        h.spawn(consumer)
+    h.sleep(1)
+
+    with c:
+        items.extend([1, 2])
+        c.notify_all()
+        # the consumers are only woken once the lock is released
+        h.sleep(10)
+        pytest.raises(vanilla.Timeout, out.recv, timeout=0)
+
+    assert out.recv() == 1
+    assert out.recv() == 2
+
+    with c:
+        pytest.raises(vanilla.Timeout, c.wait, timeout=10)
+        # the lock is held again after a timeout
+        assert c.lock.locked()
+    assert not c.lock.locked()
+
+
+def test_condition_notify_unlocked():
+    h = vanilla.Hub()
+    c = h.condition()
+    got = []
+
+    def waiter():
+        with c:
+            got.append(c.wait())
+
+    h.spawn(waiter)
+    h.sleep(1)
+
+    # notifying without the lock would strand the waiter on a free lock
+    pytest.raises(RuntimeError, c.notify)
+    pytest.raises(RuntimeError, c.notify_all)
+    assert len(c.waiters) == 1
+
+    with c:
+        c.notify()
+    h.sleep(1)
+    assert got == [True]
+
+
+def test_condition_notified_timeout():
+    h = vanilla.Hub()
+    c = h.condition()
+    got = []
+
+    def waiter():
+        with c:
+            got.append(c.wait(timeout=10))
+            assert c.lock.locked()
+
+    h.spawn(waiter)
+    h.sleep(1)
+
+    with c:
+        c.notify()
+        # hold the lock past the waiter's timeout. it was notified in time,
+        # so it waits for the lock rather than timing out
+        h.sleep(20)
+        assert got == []
+
+    h.sleep(1)
+    assert got == [True]
+    assert not c.lock.locked()
+
+
+class TestTask(object):
+    def test_result(self):
+        h = vanilla.Hub()
+
+        def add(a, b=0):
+            h.sleep(10)
+            return a + b
+
+        task = h.go(add, 1, b=2)
+        assert not task.done()
+        pytest.raises(vanilla.Timeout, task.result, timeout=0)
+        assert task.result() == 3
+        assert task.done()
+        assert task.result(timeout=0) == 3
+
+    def test_exception(self):
+        h = vanilla.Hub()
+
+        def go():
+            raise AssertionError('foo')
+
+        task = h.go(go)
+        e = pytest.raises(AssertionError, task.result)
+        # the traceback reaches back to where the task raised
+        assert e.traceback[-1].name == 'go'
+
+    def test_unretrieved(self):
+        h = vanilla.Hub()
+        logged = []
+
+        class Log(object):
+            def warn(self, message, exc_info=None):
+                logged.append(exc_info[1])
+
+        h.log = Log()
+
+        def go():
+            raise AssertionError('foo')
+
+        # retrieved, so not logged
+        task = h.go(go)
+        h.sleep(1)
+        pytest.raises(AssertionError, task.result)
+        del task
+        gc.collect()
+        assert logged == []
+
+        # never retrieved
+        task = h.go(go)
+        h.sleep(1)
+        del task
+        gc.collect()
+        assert [str(e) for e in logged] == ['foo']
+        assert not gc.garbage
+
+        # cancelling isn't an error
+        task = h.go(h.sleep, 10)
+        h.sleep(1)
+        task.cancel()
+        h.sleep(1)
+        del task
+        gc.collect()
+        assert len(logged) == 1
+
+    def test_ondone(self):
+        h = vanilla.Hub()
+        got = []
+        task = h.go(lambda: 3)
+        task.ondone(got.append, 'done')
+        h.sleep(1)
+        assert got == ['done']
+        task.ondone(got.append, 'again')
+        assert got == ['done', 'again']
+
+    def test_cancel(self):
+        h = vanilla.Hub()
+        got = []
+
+        # cancelled before it runs
+        task = h.go(got.append, 1)
+        assert task.cancel()
+        pytest.raises(vanilla.Cancelled, task.result)
+        assert task.cancelled()
+
+        # cancelled while it's blocked
+        def sleeper():
+            try:
+                h.sleep(20)
+            except vanilla.Cancelled:
+                got.append('cancelled')
+                raise
+
+        task = h.go(sleeper)
+        h.sleep(1)
+        assert task.cancel()
+        pytest.raises(vanilla.Cancelled, task.result)
+        assert not task.cancel()
+        assert got == ['cancelled']
+        # the sleep's timer was removed
+        assert not h.scheduled
+
+    def test_wait_any(self):
+        h = vanilla.Hub()
+        pipes = [h.pipe() for _ in xrange(3)]
+        tasks = [h.go(p.recv) for p in pipes]
+
+        h.spawn(pipes[1].send, 'b')
+        assert h.wait_any(tasks) is tasks[1]
+        assert tasks[1].result() == 'b'
+        pytest.raises(vanilla.Timeout, h.wait_any, tasks[::2], timeout=0)
+        assert all(not task.callbacks for task in tasks)
+
+        # an already finished task is returned straight away
+        assert h.wait_any(tasks, timeout=0) is tasks[1]
+
+    def test_wait_all(self):
+        h = vanilla.Hub()
+
+        def go(ms):
+            h.sleep(ms)
+            return ms
+
+        tasks = [h.go(go, ms) for ms in (60, 10, 40)]
+        pytest.raises(vanilla.Timeout, h.wait_all, tasks, timeout=25)
+        assert all(not task.callbacks for task in tasks)
+        assert h.wait_all(tasks) == tasks
+        assert [task.result(timeout=0) for task in tasks] == [60, 10, 40]
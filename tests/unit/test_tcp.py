@@ -18,3 +18,20 @@ class TestTCP(object):
 
         h.stop()
         assert not h.registered
+
+    def test_oneshot(self):
+        h = vanilla.Hub()
+        server = h.tcp.listen(oneshot=True)
+
+        @h.spawn
+        def _():
+            for conn in server:
+                conn.send('Echo: ' + conn.recv())
+
+        for name in ('Toby', 'Andy'):
+            client = h.tcp.connect(server.port)
+            client.send(name)
+            assert client.recv() == 'Echo: ' + name
+
+        h.stop()
+        assert not h.registered
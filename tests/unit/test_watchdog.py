@@ -0,0 +1,180 @@
+import threading
+import os
+
+import greenlet
+
+import vanilla
+
+
+class Clock(object):
+    # a clock for the watchdog which only moves when it's told to, so what's
+    # reported doesn't depend on how quickly the test runs
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, ms):
+        self.now += ms / 1000.0
+
+
+def watchdog(h, threshold=20):
+    clock = Clock()
+    reports = []
+    h.watchdog.clock = clock
+    h.watchdog.start(
+        threshold=threshold, callback=lambda *a: reports.append(a),
+        interval=0)
+    return clock, reports
+
+
+class TestWatchdog(object):
+    def test_watchdog(self):
+        h = vanilla.Hub()
+        clock, reports = watchdog(h)
+
+        def hog():
+            clock.advance(50)
+
+        h.spawn(hog)
+        h.sleep(10)
+        h.watchdog.stop()
+
+        assert [(name, ms) for name, ms, stack in reports] == [('hog', 50)]
+
+    def test_yield(self):
+        h = vanilla.Hub()
+        clock, reports = watchdog(h)
+
+        def hog():
+            clock.advance(50)
+            h.sleep(1)
+
+        h.spawn(hog)
+        h.sleep(10)
+        h.watchdog.stop()
+
+        name, ms, stack = reports[-1]
+        assert name == 'hog'
+        assert 'hog' in ''.join(stack)
+
+    def test_stall(self):
+        h = vanilla.Hub()
+        clock, reports = watchdog(h)
+
+        def hog():
+            clock.advance(50)
+            # a sample catches us while we're still running, and only once
+            h.watchdog.sample()
+            h.watchdog.sample()
+            assert len(reports) == 1
+            name, ms, stack = reports[0]
+            assert name == 'hog'
+            assert 'hog' in ''.join(stack)
+
+        h.spawn(hog)
+        h.sleep(10)
+        h.watchdog.stop()
+        # and then it's reported as it switches away
+        assert len(reports) == 2
+
+    def test_quiet(self):
+        h = vanilla.Hub()
+        clock, reports = watchdog(h)
+
+        # short tasks with polls between them aren't a stall
+        for i in xrange(10):
+            h.spawn(clock.advance, 10)
+            h.spawn(h.watchdog.sample)
+            h.sleep(1)
+        h.watchdog.stop()
+        assert not reports
+
+    def test_loop(self):
+        h = vanilla.Hub()
+        clock, reports = watchdog(h)
+
+        # but a turn of the loop made of many short tasks is, even though
+        # none of them is reported itself
+        h.sleep(1)
+        # the helper thread would notice the poll
+        h.watchdog.sample()
+        for i in xrange(10):
+            h.spawn(clock.advance, 10)
+        # each stretch without a poll is reported once
+        h.spawn(h.watchdog.sample)
+        h.spawn(h.watchdog.sample)
+        h.sleep(10)
+        h.watchdog.stop()
+        assert [(name, round(ms)) for name, ms, stack in reports] == [
+            ('loop', 100)]
+        name, ms, stack = reports[0]
+        assert 'sample' in ''.join(stack)
+
+    def test_idle_poll(self):
+        h = vanilla.Hub()
+        clock, reports = watchdog(h)
+
+        r, w = os.pipe()
+        watch = h.watch(r, vanilla.poll.POLLIN)
+
+        def idle():
+            # the loop is sitting in poll while this runs
+            clock.advance(1000)
+            h.watchdog.sample()
+            os.write(w, 'x')
+
+        threading.Timer(0.01, idle).start()
+        watch.wait(vanilla.poll.POLLIN)
+        h.sleep(1)
+        h.watchdog.stop()
+        assert not reports
+
+        h.unregister(r)
+        os.close(r)
+        os.close(w)
+
+    def test_helper_thread(self):
+        h = vanilla.Hub()
+        clock = Clock()
+        reports = []
+        h.watchdog.clock = clock
+        h.watchdog.start(
+            threshold=20, callback=lambda *a: reports.append(a), interval=1)
+        assert h.watchdog.thread.is_alive()
+        h.watchdog.stop()
+        assert h.watchdog.thread is None
+
+    def test_hubs(self):
+        # two Hubs on the same thread, and another trace hook
+        traced = []
+
+        def hook(event, args):
+            traced.append(event)
+
+        greenlet.settrace(hook)
+        try:
+            h1 = vanilla.Hub()
+            h2 = vanilla.Hub()
+            clock1, reports1 = watchdog(h1)
+            clock2, reports2 = watchdog(h2)
+
+            def hog():
+                clock1.advance(50)
+                clock2.advance(50)
+
+            h1.spawn(hog)
+            h1.sleep(10)
+            h2.sleep(10)
+            # each watchdog only sees switches on its own Hub
+            assert [name for name, ms, stack in reports1] == ['hog']
+            assert not reports2
+            # and the hook installed beforehand still sees every switch
+            assert 'switch' in traced
+
+            h1.watchdog.stop()
+            h2.watchdog.stop()
+            assert greenlet.gettrace() is hook
+        finally:
+            greenlet.settrace(None)
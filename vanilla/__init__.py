@@ -4,6 +4,7 @@ from vanilla.core import Hub
 
 from vanilla.exception import ConnectionLost
 from vanilla.exception import Abandoned
+from vanilla.exception import Cancelled
 from vanilla.exception import Timeout
 from vanilla.exception import Closed
 from vanilla.exception import Stop
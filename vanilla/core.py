@@ -1,12 +1,19 @@
 from __future__ import absolute_import
 
 import collections
+import ctypes.util
 import functools
 import importlib
+import itertools
 import logging
+import pkgutil
+import ctypes
 import signal
+import types
 import heapq
+import math
 import time
+import sys
 
 
 from greenlet import getcurrent
@@ -15,6 +22,7 @@ from greenlet import greenlet
 import vanilla.exception
 import vanilla.message
 import vanilla.poll
+import vanilla.sync
 
 
 log = logging.getLogger(__name__)
@@ -30,46 +38,744 @@ class lazy(object):
         return value
 
 
+CLOCK_MONOTONIC = 1
+CLOCK_MONOTONIC_COARSE = 6
+
+
+def clock(clk_id):
+    """
+    Returns a callable which reads the POSIX clock *clk_id* in seconds. Falls
+    back to time.time where clock_gettime isn't available.
+
+    Python 2 has no time.monotonic, so clock_gettime is called through
+    ctypes. A read costs about 1us, over ten times as much as time.time, but
+    the Hub's loop only reads its clock once per turn, and as green threads
+    arm timers, so a wall clock step can't fire or stall every timer at once.
+    """
+    if not sys.platform.startswith('linux'):
+        return time.time
+
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        clock_gettime = libc.clock_gettime
+    except (OSError, AttributeError):
+        log.warn('unable to load clock_gettime: falling back to time.time')
+        return time.time
+
+    class timespec(ctypes.Structure):
+        _fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+
+    ts = timespec()
+    ref = ctypes.byref(ts)
+
+    if clock_gettime(clk_id, ref):
+        return time.time
+
+    def read():
+        clock_gettime(clk_id, ref)
+        return ts.tv_sec + ts.tv_nsec * 1e-9
+    return read
+
+
+monotonic = clock(CLOCK_MONOTONIC)
+monotonic_coarse = clock(CLOCK_MONOTONIC_COARSE)
+
+
+def coalesce(due, slack):
+    """
+    Rounds *due*, in seconds, up to the next multiple of *slack*
+    milliseconds. Timers due within the same window of *slack* end up with
+    the same due time, so they fire together on a single wake up.
+    """
+    slack = slack / 1000.0
+    return math.ceil(due / slack) * slack
+
+
 class Scheduler(object):
-    Item = collections.namedtuple('Item', ['due', 'action', 'args'])
+    """
+    A heap of timers. Timers are added with `add`, which applies the
+    scheduler's default *slack*, or `arm`, which takes a *slack* per timer.
+    A timer with slack may fire up to *slack* milliseconds late, see
+    `coalesce`.
+    """
+    Item = collections.namedtuple('Item', ['due', 'seq', 'action', 'args'])
 
-    def __init__(self):
-        self.count = 0
+    def __init__(self, clock=time.time, slack=0):
+        self.clock = clock
+        self.slack = slack
+        self.seq = 0
         self.queue = []
-        self.removed = {}
+        # timers which are yet to be popped or removed
+        self.live = set()
 
     def add(self, delay, action, *args):
-        due = time.time() + (delay / 1000.0)
-        item = self.Item(due, action, args)
+        return self.arm(delay, self.slack, action, args)
+
+    def arm(self, delay, slack, action, args):
+        due = self.clock() + (delay / 1000.0)
+        if slack:
+            due = coalesce(due, slack)
+        self.seq += 1
+        item = self.Item(due, self.seq, action, args)
         heapq.heappush(self.queue, item)
-        self.count += 1
+        self.live.add(self.seq)
         return item
 
     def __len__(self):
-        return self.count
+        return len(self.live)
 
     def remove(self, item):
-        self.removed[item] = True
-        self.count -= 1
+        # removing a timer which has already been popped is a no op
+        self.live.discard(item.seq)
 
     def prune(self):
         while True:
-            if self.queue[0] not in self.removed:
+            if self.queue[0].seq in self.live:
                 break
-            item = heapq.heappop(self.queue)
-            del self.removed[item]
+            heapq.heappop(self.queue)
 
     def timeout(self):
         self.prune()
-        return self.queue[0].due - time.time()
+        return self.queue[0].due - self.clock()
 
     def pop(self):
         self.prune()
         item = heapq.heappop(self.queue)
+        self.live.remove(item.seq)
+        return item.action, item.args
+
+
+class Wheel(object):
+    """
+    A hierarchical timing wheel. Time is divided into ticks of *resolution*
+    milliseconds. Each level of the wheel has 1 << *bits* slots, with a slot
+    on the lowest level covering a single tick and a slot on each level above
+    covering a full turn of the level below. Timers further out than the top
+    level are held in an overflow slot.
+
+    Adding and removing a timer is O(1): removal is a real removal, not a
+    tombstone. As the wheel turns, a slot on a higher level is cascaded down to
+    the levels below, and all timers on a lowest level slot expire together.
+
+    Timers fire on the first tick at or after their due time, so the wheel
+    trades precision for cheap arming and cancelling. `Scheduler` remains
+    available for when exact deadlines are important. *slack* is applied as
+    for `Scheduler`.
+    """
+    class Item(object):
+        __slots__ = ['due', 'seq', 'action', 'args', 'slot', 'level']
+
+        def __init__(self, due, seq, action, args):
+            self.due = due
+            self.seq = seq
+            self.action = action
+            self.args = args
+            self.slot = None
+            self.level = None
+
+    def __init__(
+            self, clock=time.time, resolution=1, bits=6, levels=4, slack=0):
+        self.clock = clock
+        self.slack = slack
+        self.resolution = resolution / 1000.0
+        self.bits = bits
+        self.mask = (1 << bits) - 1
+        self.levels = [[{} for _ in xrange(1 << bits)] for _ in xrange(levels)]
+        self.overflow = {}
+        # live timers per level, the last entry counts the overflow slot
+        self.counts = [0] * (levels + 1)
+        self.count = 0
+        self.seq = 0
+        # expired timers, in due order, waiting to be popped
+        self.expired = collections.deque()
+        # the next tick to be processed
+        self.tick = int(self.clock() / self.resolution)
+
+    def add(self, delay, action, *args):
+        return self.arm(delay, self.slack, action, args)
+
+    def arm(self, delay, slack, action, args):
+        self.seq += 1
+        due = self.clock() + (delay / 1000.0)
+        if slack:
+            due = coalesce(due, slack)
+        item = self.Item(due, self.seq, action, args)
+        self.place(item)
+        self.count += 1
+        return item
+
+    def __len__(self):
+        return self.count
+
+    def place(self, item):
+        tick = int(math.ceil(item.due / self.resolution))
+        delta = tick - self.tick
+
+        if delta < 0:
+            item.slot = self.expired
+            self.expired.append(item)
+            return
+
+        if delta <= self.mask:
+            level = 0
+            slot = self.levels[0][tick & self.mask]
+        else:
+            for level in xrange(1, len(self.levels)):
+                shift = self.bits * level
+                if (tick >> shift) - (self.tick >> shift) <= self.mask:
+                    slot = self.levels[level][(tick >> shift) & self.mask]
+                    break
+            else:
+                level = len(self.levels)
+                slot = self.overflow
+
+        slot[item] = True
+        item.slot = slot
+        item.level = level
+        self.counts[level] += 1
+
+    def remove(self, item):
+        slot = item.slot
+        if slot is None:
+            return
+        item.slot = None
+        self.count -= 1
+        if slot is not self.expired:
+            del slot[item]
+            self.counts[item.level] -= 1
+
+    def cascade(self, level, index):
+        if level == len(self.levels):
+            slot = self.overflow
+        else:
+            slot = self.levels[level][index]
+        if not slot:
+            return
+        items = slot.keys()
+        slot.clear()
+        self.counts[level] -= len(items)
+        for item in items:
+            self.place(item)
+
+    def advance(self, until):
+        """
+        Turns the wheel through to tick *until*, cascading higher levels and
+        expiring the lowest level as it goes. Stretches of ticks where nothing
+        could expire are skipped.
+        """
+        top = len(self.levels)
+        while self.tick <= until:
+            t = self.tick
+
+            for level in xrange(top, 0, -1):
+                shift = self.bits * level
+                if not t & ((1 << shift) - 1):
+                    self.cascade(level, (t >> shift) & self.mask)
+
+            slot = self.levels[0][t & self.mask]
+            if slot:
+                items = sorted(slot, key=lambda x: (x.due, x.seq))
+                slot.clear()
+                self.counts[0] -= len(items)
+                for item in items:
+                    item.slot = self.expired
+                self.expired.extend(items)
+
+            t += 1
+            if not self.counts[0]:
+                for level in xrange(1, top + 1):
+                    if self.counts[level]:
+                        step = (1 << (self.bits * level)) - 1
+                        t = min((t + step) & ~step, until + 1)
+                        break
+                else:
+                    t = until + 1
+            self.tick = t
+
+    def next(self):
+        """
+        Returns the earliest tick at which a timer could expire or cascade.
+        """
+        best = None
+        for level, slots in enumerate(self.levels):
+            if not self.counts[level]:
+                continue
+            shift = self.bits * level
+            base = self.tick >> shift
+            for offset in xrange(self.mask + 1):
+                if slots[(base + offset) & self.mask]:
+                    tick = (base + offset) << shift
+                    break
+            if best is None or tick < best:
+                best = tick
+
+        if self.counts[-1]:
+            shift = self.bits * len(self.levels)
+            tick = ((self.tick >> shift) + 1) << shift
+            if best is None or tick < best:
+                best = tick
+
+        return best
+
+    def prune(self):
+        while self.expired and self.expired[0].slot is None:
+            self.expired.popleft()
+
+    def timeout(self):
+        now = self.clock()
+        self.advance(int(now / self.resolution))
+        self.prune()
+        if self.expired:
+            return self.expired[0].due - now
+        return self.next() * self.resolution - now
+
+    def pop(self):
+        self.prune()
+        while not self.expired:
+            self.advance(self.next())
+            self.prune()
+        item = self.expired.popleft()
+        item.slot = None
         self.count -= 1
         return item.action, item.args
 
 
+class Workers(object):
+    """
+    A pool of parked greenlets which run spawned callables. Once its callable
+    returns, a worker parks itself back in the pool to be reused, rather than
+    a greenlet being created and torn down for every task. At most *max_idle*
+    workers are kept parked.
+
+    *hits* counts tasks run on a parked worker, *misses* tasks which needed a
+    new greenlet.
+    """
+    def __init__(self, hub, max_idle):
+        self.hub = hub
+        self.max_idle = max_idle
+        self.idle = []
+        self.hits = 0
+        self.misses = 0
+
+    def run(self, task, a):
+        while self.idle:
+            worker = self.idle.pop()
+            if not worker.dead:
+                self.hits += 1
+                worker.priority = self.hub.priority
+                return worker.switch(task, a)
+        self.misses += 1
+        # tasks are always passed by switching to a started worker, as a
+        # greenlet holds on to its initial arguments until it's done
+        worker = greenlet(self.work)
+        worker.priority = self.hub.priority
+        worker.switch()
+        return worker.switch(task, a)
+
+    def work(self):
+        got = None
+        while True:
+            # ignore any stray wake ups while parked
+            while not got:
+                got = self.hub.loop.switch()
+            task, a = got
+
+            try:
+                task(*a)
+            except Exception:
+                self.hub.log.warn(
+                    'Exception leaked back to main loop', exc_info=True)
+                sys.exc_clear()
+
+            # drop references to the finished task before parking
+            task = a = got = None
+
+            if len(self.idle) >= self.max_idle:
+                return
+            self.idle.append(getcurrent())
+
+
+class Stats(object):
+    """
+    Counters kept by a Hub's loop, see `Hub.stats`. The loop only runs its
+    instrumented path when these are enabled, so a Hub without them pays
+    nothing more than a check per turn of the loop.
+    """
+    def __init__(self, hub):
+        self.hub = hub
+        self.iterations = 0
+        self.tasks = 0
+        self.ready_high = 0
+        self.polls = 0
+        self.events = 0
+        self.events_high = 0
+        self.run_time = 0.0
+        self.poll_time = 0.0
+
+    def turn(self):
+        self.iterations += 1
+        depth = sum(len(queue) for queue in self.hub.queues)
+        if depth > self.ready_high:
+            self.ready_high = depth
+
+    def drain(self):
+        hub = self.hub
+        ready = hub.ready
+        urgent = hub.queues[hub.HIGH]
+        self.turn()
+        # the loop read the clock as the turn started
+        start = hub.time
+        while ready:
+            task, a = ready.popleft()
+            self.tasks += 1
+            hub.run_task(task, *a)
+            if urgent:
+                break
+        self.run_time += monotonic() - start
+
+    def run(self, task, a):
+        start = monotonic()
+        self.tasks += 1
+        self.hub.run_task(task, *a)
+        self.run_time += monotonic() - start
+
+    def harvest(self, timeout):
+        start = monotonic()
+        try:
+            n = self.hub.poll.harvest(timeout)
+        finally:
+            self.poll_time += monotonic() - start
+            self.polls += 1
+        self.events += n
+        if n > self.events_high:
+            self.events_high = n
+        return n
+
+    def dispatch(self, fds, masks):
+        # green threads waiting on I/O are switched to straight from the
+        # loop, so they're counted and timed here rather than in drain
+        start = self.hub.time
+        self.hub.dispatch_events(fds, masks, self)
+        self.run_time += monotonic() - start
+
+    def snapshot(self):
+        hub = self.hub
+        return {
+            'iterations': self.iterations,
+            'tasks': self.tasks,
+            'ready': sum(len(queue) for queue in hub.queues),
+            'ready_high': self.ready_high,
+            'scheduled': len(hub.scheduled),
+            'registered': len(hub.registered),
+            'polls': self.polls,
+            'events': self.events,
+            'events_high': self.events_high,
+            'events_per_poll':
+                self.polls and self.events / float(self.polls) or 0.0,
+            'exhausted': hub.budget and hub.budget.exhausted or 0,
+            'run_time': self.run_time,
+            'poll_time': self.poll_time, }
+
+
+class Watch(object):
+    """
+    A file descriptor registered with the Hub's poller, see `Hub.watch`.
+
+    A green thread blocks on the descriptor with `wait`. When the descriptor
+    becomes ready, the Hub's loop switches straight back to the waiting green
+    thread, without going through a `Pipe`_ or an intermediate green thread.
+
+    The descriptor is polled for *masks* for as long as it's registered. It
+    can also be waited on for other masks, which are only polled while
+    they're waited on, e.g. POLLOUT while a write would block.
+
+    A level triggered poller would report a ready descriptor on every pass
+    of the loop for as long as no one reads it, so with one, even *masks*
+    are only polled while they're waited on. A mask is left armed once its
+    waiter is woken, so a green thread which waits again straight away costs
+    no syscall, and disarmed if it's reported while no one is waiting.
+    """
+    def __init__(self, hub, fd, masks, priority, oneshot=False):
+        self.hub = hub
+        self.fd = fd
+        self.masks = masks
+        self.priority = priority
+        self.oneshot = oneshot
+        self.level = not hub.poll.edge
+        self.waiters = {vanilla.poll.POLLIN: None, vanilla.poll.POLLOUT: None}
+        self.closed = False
+        self.closers = []
+
+    def interest(self):
+        masks = [] if self.level else list(self.masks)
+        for mask, waiter in self.waiters.iteritems():
+            if waiter is not None and mask not in masks:
+                masks.append(mask)
+        return masks
+
+    def wait(self, mask, timeout=-1):
+        """
+        Blocks until the descriptor is ready for *mask*, either forever or
+        until *timeout* milliseconds. Raises Closed if the descriptor errors
+        or is unregistered.
+        """
+        if self.closed:
+            raise vanilla.exception.Closed
+        assert self.waiters[mask] is None
+        self.waiters[mask] = getcurrent()
+        transient = mask not in self.masks
+        try:
+            # the poller only goes to the kernel if the interest has changed,
+            # or to rearm a oneshot descriptor
+            if transient or self.oneshot or self.level:
+                self.hub.poll.modify(self.fd, *self.interest())
+            self.hub.pause(timeout=timeout)
+        finally:
+            self.waiters[mask] = None
+            if transient and not self.level and not self.closed:
+                try:
+                    self.hub.poll.modify(self.fd, *self.interest())
+                except (IOError, OSError):
+                    # the descriptor's been closed under us
+                    pass
+        if self.closed:
+            raise vanilla.exception.Closed
+
+    def onclose(self, f, *a):
+        self.closers.append((f, a))
+
+    def disarm(self):
+        # reported by a level triggered poller with no one waiting, so stop
+        # polling for the masks no one is waiting on. a oneshot descriptor
+        # has already been disarmed by the poller
+        if self.oneshot or self.closed:
+            return
+        try:
+            self.hub.poll.modify(self.fd, *self.interest())
+        except (IOError, OSError):
+            pass
+
+    def error(self):
+        # this runs on the Hub's loop, so waiters are switched to directly and
+        # closers are spawned
+        if self.closed:
+            return
+        self.closed = True
+        for waiter in self.waiters.values():
+            if waiter is not None:
+                self.hub.run_task(waiter)
+        closers, self.closers = self.closers, []
+        for f, a in closers:
+            self.hub.spawn(f, *a)
+
+    def close(self, exception=vanilla.exception.Closed):
+        if self.closed:
+            return
+        self.closed = True
+        for waiter in self.waiters.values():
+            if waiter is not None:
+                self.hub.throw_to(waiter, exception)
+        closers, self.closers = self.closers, []
+        for f, a in closers:
+            try:
+                f(*a)
+            except vanilla.exception.Halt:
+                pass
+
+    def stop(self):
+        self.close(exception=vanilla.exception.Stop)
+
+
+class Budget(object):
+    """
+    Bounds how much of the ready queues a Hub's loop runs per turn, see `Hub`.
+    Each turn runs at most *tasks* tasks and stops once *ms* milliseconds
+    have passed, whichever comes first. *exhausted* counts the turns which
+    ran out of budget with tasks still ready.
+    """
+    def __init__(self, hub, tasks=None, ms=None):
+        self.hub = hub
+        self.tasks = tasks
+        self.ms = ms
+        self.exhausted = 0
+
+
+class Periodic(object):
+    """
+    A timer which comes due every *ms* milliseconds and feeds a `Pulse`, see
+    `Hub.pulse`. Each tick is scheduled relative to the first, rather than to
+    when the last tick ran, so the period doesn't drift with the latency of
+    the loop or of the consumer.
+
+    Ticks are handled inline on the Hub's loop. When a tick comes due it's
+    handed straight to the consumer if it's waiting, without a green thread
+    of its own. Otherwise ticks are held for the consumer's next recv
+    according to *policy*:
+
+    - `SKIP`: at most one tick is held, and further ticks are dropped until
+      the consumer catches up
+    - `CATCHUP`: every tick is held, so a lagging consumer receives a burst
+      of ticks to make up for the ones it missed
+    """
+    SKIP, CATCHUP = 'skip', 'catchup'
+
+    def __init__(self, hub, ms, item=True, policy=SKIP):
+        if policy not in (self.SKIP, self.CATCHUP):
+            raise ValueError('unknown policy: %r' % (policy,))
+        self.hub = hub
+        self.ms = ms
+        self.period = ms / 1000.0
+        self.item = item
+        self.policy = policy
+        self.pending = 0
+        self.sender = None
+        self.timer = None
+        self.due = None
+
+    def start(self, sender):
+        self.sender = sender
+        sender.onclose(self.cancel)
+        self.due = self.hub.now() + self.period
+        self.timer = self.hub.scheduled.add(self.ms, self)
+
+    def __nonzero__(self):
+        # stands in for a waiting sender while ticks are held
+        return self.pending > 0
+
+    def take(self):
+        self.pending -= 1
+        return self.item
+
+    def __call__(self):
+        self.timer = None
+        sender = self.sender
+        if sender.halted:
+            self.pending = 0
+            return
+
+        now = self.hub.now()
+        # ticks which came due while the loop was busy are made up for in
+        # one go, and the next tick stays on the original schedule
+        ticks = 1 + max(0, int((now - self.due) / self.period))
+        self.due += ticks * self.period
+        self.timer = self.hub.scheduled.add((self.due - now) * 1000, self)
+
+        if self.policy == self.SKIP:
+            self.pending = 1
+        else:
+            self.pending += ticks
+
+        if sender.ready:
+            # this runs on the Hub's loop, so rather than sending, which
+            # would requeue the current green thread, we switch straight to
+            # the waiting consumer, as for I/O
+            self.pending -= 1
+            recver = sender.other
+            try:
+                recver.peak.switch(recver, self.item)
+            except Exception, e:
+                self.hub.log.warn(
+                    'Exception leaked back to main loop', exc_info=e)
+
+    def cancel(self):
+        if self.timer is not None:
+            self.hub.scheduled.remove(self.timer)
+            self.timer = None
+        self.pending = 0
+
+    def throw(self, *a):
+        # our consumer closed or was abandoned while ticks were held. the
+        # thrower was put back on the ready queue, so pause to pick that up
+        self.cancel()
+        self.hub.pause()
+
+    def stop(self):
+        """
+        Stops the timer and closes its `Pulse`.
+        """
+        self.cancel()
+        if not self.sender.halted:
+            self.sender.close()
+
+
+class Registry(object):
+    """
+    Maps plugin names to the factories which create them for a Hub, see
+    `Hub.__getattr__`. A factory is called with the Hub and returns the
+    plugin. A factory can also be given as a module name, or a module, in
+    which case the module's `__plugin__` is used. Modules are only imported
+    the first time their plugin is used.
+
+    Third party plugins are discovered through the *vanilla.plugins* entry
+    point group, or can be added with `register`. Modules dropped into the
+    vanilla namespace package are still found as before, and are looked for
+    first. Names which don't resolve to a plugin are remembered, so probing
+    for a missing plugin with hasattr is cheap.
+
+    Discovering entry points imports pkg_resources and scans every installed
+    distribution, which can take a good fraction of a second. It's only done
+    once a name is neither registered nor a vanilla module, e.g. on the first
+    hasattr probe for a missing plugin, and the result is kept for the life
+    of the process.
+    """
+    group = 'vanilla.plugins'
+
+    def __init__(self, builtin):
+        self.factories = dict((name, 'vanilla.' + name) for name in builtin)
+        self.entry_points = None
+        self.missing = set()
+
+    def register(self, name, factory):
+        self.factories[name] = factory
+        self.missing.discard(name)
+
+    def discover(self):
+        self.entry_points = {}
+        try:
+            import pkg_resources
+        except ImportError:
+            return
+        for entry_point in pkg_resources.iter_entry_points(self.group):
+            self.entry_points.setdefault(entry_point.name, entry_point)
+
+    def find(self, name):
+        if name in self.factories:
+            return self.factories[name]
+        module = 'vanilla.' + name
+        if pkgutil.find_loader(module) is not None:
+            return module
+        if self.entry_points is None:
+            self.discover()
+        if name in self.entry_points:
+            return self.entry_points[name].load()
+        return None
+
+    def load(self, name):
+        """
+        Returns the factory for the plugin *name*, or None if there's no such
+        plugin.
+        """
+        if name in self.missing:
+            return None
+        factory = self.find(name)
+        if factory is None:
+            self.missing.add(name)
+            return None
+        if isinstance(factory, basestring):
+            factory = importlib.import_module(factory)
+        if isinstance(factory, types.ModuleType):
+            factory = getattr(factory, '__plugin__', None)
+            if factory is None:
+                self.missing.add(name)
+                return None
+        self.factories[name] = factory
+        return factory
+
+
+plugins = Registry([
+    'http', 'io', 'process', 'signal', 'tcp', 'thread', 'udp', 'watchdog'])
+
+
 class Hub(object):
     """
     A Vanilla Hub is a handle to a self contained world of interwoven
@@ -78,34 +784,159 @@ class Hub(object):
     this Hub is explicit and must be passed to coroutines that need to interact
     with it. This is particularly nice for testing, as it makes it clear what's
     going on, and other tests can't inadvertently effect each other.
+
+    Timers are kept on a `Wheel` by default. Pass *scheduler* as `Scheduler`
+    to use the heap based scheduler instead, for precise deadlines.
+
+    Timers are scheduled against the Hub's monotonic loop clock, see `now`.
+    Pass *coarse* as True to read CLOCK_MONOTONIC_COARSE instead, which the
+    kernel only updates every few milliseconds, for timer heavy workloads
+    which can live with that resolution.
+
+    Spawned callables are run on a pool of recycled greenlets, see `Workers`.
+    *max_idle* is the most workers which will be kept parked.
+
+    Pass *slack* in milliseconds to let timers fire up to that late, so that
+    timers due at about the same time are coalesced into a single wake up of
+    the loop, see `coalesce`. `sleep` and `spawn_later` can override it per
+    timer.
+
+    Descriptors are polled with `vanilla.poll.Poll`, kqueue or edge triggered
+    epoll, by default. Pass *poller* to use another of the backends in
+    `vanilla.poll.backends` instead, such as `vanilla.poll.Uring`. Each poll
+    collects at most *maxevents* ready events, which are dispatched as a
+    batch.
+
+    Pass *stats* as True to have the loop keep runtime counters, see `stats`.
+
+    Plugins are created the first time they're used, see `Registry`. Pass
+    *preload* as a list of plugin names to create them up front instead.
+
+    By default the loop runs the ready queue to exhaustion before it polls
+    again. Pass *budget*, a number of tasks, and or *budget_ms* to bound each
+    turn instead, see `Budget`. When a turn's budget runs out, overdue timers
+    are run and registered descriptors are polled without blocking before
+    the loop goes back to the ready queue, so a burst of work can't starve
+    I/O.
+
+    Tasks can be spawned with a *priority* of `HIGH`, `NORMAL` or `LOW`, each
+    with its own ready queue. The queues are run round robin from highest to
+    lowest, taking up to `weights` tasks from each per round, so lower
+    priorities are slowed but never starved.
     """
-    def __init__(self):
+    HIGH, NORMAL, LOW = 0, 1, 2
+    weights = (8, 4, 1)
+
+    def __init__(
+            self, scheduler=Wheel, coarse=False, max_idle=64, stats=False,
+            budget=None, budget_ms=None, preload=(), slack=0,
+            poller=vanilla.poll.Poll, maxevents=1024):
         self.log = logging.getLogger('%s.%s' % (__name__, self.__class__))
 
+        self.clock = coarse and monotonic_coarse or monotonic
+        self.time = self.clock()
+        self.loop = greenlet(self.main)
+
         self.ready = collections.deque()
-        self.scheduled = Scheduler()
+        self.queues = (collections.deque(), self.ready, collections.deque())
+        self.priority = self.NORMAL
+        self.scheduled = scheduler(clock=self.refresh, slack=slack)
+        self.workers = Workers(self, max_idle)
+        self.counters = stats and Stats(self) or None
+        self.budget = None
+        if budget or budget_ms:
+            self.budget = Budget(self, budget, budget_ms)
 
         self.stopped = self.state()
 
         self.registered = {}
-        self.poll = vanilla.poll.Poll()
-        self.loop = greenlet(self.main)
+        self.prioritized = 0
+        # whether the loop is blocked waiting for I/O or the next timer, and
+        # how many times it has been, see the watchdog
+        self.polling = False
+        self.polls = 0
+        self.poll = poller(maxevents=maxevents)
+
+        for name in preload:
+            getattr(self, name)
 
     def __getattr__(self, name):
         # facilitates dynamic plugin look up
+        if name.startswith('_'):
+            raise AttributeError(name)
         try:
-            package = '.'.join(__name__.split('.')[:-1])
-            module = importlib.import_module('.'+name, package=package)
-            plugin = module.__plugin__(self)
-            setattr(self, name, plugin)
-            return plugin
+            factory = plugins.load(name)
+            if factory is not None:
+                plugin = factory(self)
+                setattr(self, name, plugin)
+                return plugin
         except Exception, e:
             log.exception(e)
-            raise AttributeError(
-                "'Hub' object has no attribute '{name}'\n"
-                "You may be trying to use a plugin named vanilla.{name}. "
-                "If you are, you still need to install it".format(
-                    name=name))
+        raise AttributeError(
+            "'Hub' object has no attribute '{name}'\n"
+            "You may be trying to use a plugin named vanilla.{name}. "
+            "If you are, you still need to install it".format(name=name))
+
+    def now(self):
+        """
+        Returns the time of the current tick of the Hub's loop, in seconds. The
+        monotonic clock is read once per turn of the loop and cached, so this
+        is cheap to call and immune to wall clock adjustments. All timers are
+        scheduled relative to it.
+        """
+        if not self.loop:
+            # the loop hasn't started, or has stopped, so there's no turn to
+            # have cached the time
+            self.time = self.clock()
+        return self.time
+
+    def refresh(self):
+        # the time timers are armed against. a green thread may have run for
+        # a while since the turn started, so timers it arms would be due
+        # early against the turn's time: the clock is read afresh for them.
+        # the loop itself works from the turn's time
+        if getcurrent() is not self.loop:
+            self.time = self.clock()
+        return self.time
+
+    def stats(self):
+        """
+        Returns a snapshot dict of what the Hub's loop has been doing:
+
+        - *iterations*: turns of the loop
+        - *tasks*: tasks run, including timers and green threads woken by
+          I/O, which the loop switches to directly
+        - *ready*, *ready_high*: ready queue depth and its high water mark
+        - *scheduled*: timers pending
+        - *registered*: file descriptors registered
+        - *polls*, *events*, *events_high*, *events_per_poll*: calls to poll
+          and the events they dispatched
+        - *run_time*, *poll_time*: seconds spent running tasks, again
+          including those woken by I/O, and polling
+
+        Only the gauges, *ready*, *scheduled* and *registered*, are filled in
+        unless the Hub was created with *stats* True, or `monitor` was called.
+        """
+        return (self.counters or Stats(self)).snapshot()
+
+    def monitor(self, ms, f):
+        """
+        Enables the Hub's counters and spawns a green thread which calls
+        *f(stats)* every *ms* milliseconds with a `stats` snapshot::
+
+            h.monitor(1000, lambda stats: log.info('hub: %r', stats))
+        """
+        if self.counters is None:
+            self.counters = Stats(self)
+
+        @self.spawn
+        def _():
+            while True:
+                try:
+                    self.sleep(ms)
+                except vanilla.exception.Halt:
+                    return
+                f(self.stats())
 
     def pipe(self):
         """
@@ -146,29 +977,25 @@ class Hub(object):
                 f(item)
         return sender
 
-    def pulse(self, ms, item=True):
+    def pulse(self, ms, item=True, policy=Periodic.SKIP):
         """
         Convenience to create a `Pipe`_ that will have *item* sent on it every
-        *ms* milliseconds. The `Recver`_ end of the Pipe is returned.
-
-        Note that since sends to a Pipe block until the Recver is ready, the
-        pulses will be throttled if the Recver is unable to keep up::
+        *ms* milliseconds. The `Recver`_ end of the Pipe is returned::
 
             recver = h.pulse(500)
 
             for _ in recver:
                 log.info('hello') # logs 'hello' every half a second
+
+        The pipe is fed by a `Periodic` timer, which keeps to its original
+        schedule rather than drifting. If the Recver is unable to keep up, by
+        default only one pulse is held for it and the rest are skipped. Pass
+        *policy* as 'catchup' to have every missed pulse held instead.
         """
-        @self.producer
-        def _(sender):
-            while True:
-                try:
-                    self.sleep(ms)
-                except vanilla.exception.Halt:
-                    break
-                sender.send(item)
-            sender.close()
-        return _
+        timer = Periodic(self, ms, item, policy)
+        sender, recver = vanilla.message.Pulse(self, timer)
+        timer.start(sender)
+        return recver
 
     def trigger(self, f):
         def consume(recver, f):
@@ -208,37 +1035,63 @@ class Hub(object):
         A Channel can have many senders and many recvers. By default it is
         unbuffered, but you can create buffered Channels by specifying a size.
         They're structurally equivalent to channels in Go. It's implementation
-        is *literally* a `Router`_ piped to a `Dealer`_, with an optional
-        `Queue`_ in between.
+        is a `Router`_'s Sender and a `Dealer`_'s Recver on either side of a
+        single middle, which is buffered as for a `Queue`_ if there's a size.
         """
-        sender, recver = self.router()
-        if size > 0:
-            recver = recver.pipe(self.queue(size))
-        return vanilla.message.Pair(sender, recver.pipe(self.dealer()))
+        return vanilla.message.Channel(self, size)
 
     def serialize(self, f):
         """
-        Decorator to serialize access to a callable *f*
+        Decorator to serialize access to a callable *f*. Calls are made on the
+        calling green thread while holding a `Lock`, in the order they were
+        made.
+
+        Calls used to be handed to a serving green thread, and an exception
+        *f* raised was sent back to be raised in the caller. Running on the
+        caller's green thread, *f* now sees the caller's `getcurrent` and
+        priority, and its exceptions propagate to the caller directly, with
+        their traceback intact. Either way, the lock is released for the next
+        call.
         """
-        s = self.router()
-
-        @self.spawn
-        def _():
-            for f, a, kw, r in s.recver:
-                try:
-                    r.send(f(*a, **kw))
-                except Exception, e:
-                    r.send(e)
+        lock = self.lock()
 
+        @functools.wraps(f)
         def _(*a, **kw):
-            r = self.pipe()
-            s.send((f, a, kw, r))
-            return r.recv()
+            with lock:
+                return f(*a, **kw)
 
         return _
 
-    def broadcast(self):
-        return vanilla.message.Broadcast(self)
+    def lock(self):
+        """
+        Returns a `Lock`.
+        """
+        return vanilla.sync.Lock(self)
+
+    def semaphore(self, value=1):
+        """
+        Returns a `Semaphore` which *value* green threads can hold at once.
+        """
+        return vanilla.sync.Semaphore(self, value)
+
+    def event(self):
+        """
+        Returns an `Event`.
+        """
+        return vanilla.sync.Event(self)
+
+    def condition(self, lock=None):
+        """
+        Returns a `Condition` over *lock*, or over a new `Lock`.
+        """
+        return vanilla.sync.Condition(self, lock)
+
+    def broadcast(self, size=None, policy=vanilla.message.BLOCK):
+        """
+        Returns a `Broadcast`_. *size* and *policy* are the defaults for its
+        subscribers.
+        """
+        return vanilla.message.Broadcast(self, size=size, policy=policy)
 
     def state(self, state=vanilla.message.NoState):
         """
@@ -248,8 +1101,13 @@ class Hub(object):
         """
         return vanilla.message.State(self, state=state)
 
-    def value(self):
-        return vanilla.message.Value(self)
+    def value(self, item=vanilla.message.NoState):
+        """
+        Returns a `Value`_.
+
+        *item* if supplied sets the initial item, as version 1.
+        """
+        return vanilla.message.Value(self, item=item)
 
     def select(self, ends, timeout=-1):
         """
@@ -294,6 +1152,18 @@ class Hub(object):
 
         return fired, item
 
+    def selector(self, ends=()):
+        """
+        Returns a `Selector`_ over *ends*: a `select` whose ends stay
+        registered between waits. It's the better fit for a loop which
+        selects over much the same ends each time round::
+
+            selector = h.selector([upstream, downstream])
+            while True:
+                end, value = selector.wait()
+        """
+        return vanilla.message.Selector(self, ends)
+
     def pause(self, timeout=-1):
         if timeout > -1:
             item = self.scheduled.add(
@@ -320,19 +1190,30 @@ class Hub(object):
 
         return resume
 
+    def requeue(self):
+        # puts the current green thread back on the ready queue for its
+        # priority, see `spawn`
+        self.wake(getcurrent())
+
+    def wake(self, task, *a):
+        # queues a paused green thread to be resumed with *a* on the ready
+        # queue for its priority
+        priority = getattr(task, 'priority', self.NORMAL)
+        self.queues[priority].append((task, a))
+
     def switch_to(self, target, *a):
-        self.ready.append((getcurrent(), ()))
+        self.requeue()
         return target.switch(*a)
 
     def throw_to(self, target, *a):
-        self.ready.append((getcurrent(), ()))
+        self.requeue()
         """
         if len(a) == 1 and isinstance(a[0], preserve_exception):
             return target.throw(a[0].typ, a[0].val, a[0].tb)
         """
         return target.throw(*a)
 
-    def spawn(self, f, *a):
+    def spawn(self, f, *a, **kw):
         """
         Schedules a new green thread to be created to run *f(\*a)* on the next
         available tick::
@@ -343,10 +1224,82 @@ class Hub(object):
             p = h.pipe()
             h.spawn(echo, p, 'hi')
             p.recv() # returns 'hi'
+
+        Pass *priority* as `HIGH` or `LOW` to queue the green thread ahead of
+        or behind `NORMAL` work::
+
+            h.spawn(heartbeat, priority=h.HIGH)
+
+        The priority sticks with the green thread: each time it's resumed
+        after blocking, or waking from `sleep`, it's queued on the ready queue
+        for its priority.
+        """
+        priority = kw.pop('priority', self.NORMAL)
+        if kw:
+            raise TypeError('unexpected keyword arguments: %s' % ', '.join(kw))
+        self.queues[priority].append((f, a))
+
+    def go(self, f, *a, **kw):
+        """
+        Spawns *f(\*a, \*\*kw)* like `spawn`, and returns a `Task` handle for
+        its result::
+
+            task = h.go(fetch, url)
+            body = task.result()
+
+        Pass *priority* as for `spawn`.
+        """
+        priority = kw.pop('priority', self.NORMAL)
+        task = vanilla.sync.Task(self, f, a, kw)
+        self.queues[priority].append((task.run, ()))
+        return task
+
+    def wait_any(self, tasks, timeout=-1):
+        """
+        Blocks until any of *tasks* has finished, either forever or until
+        *timeout* milliseconds, and returns it.
+        """
+        for task in tasks:
+            if task.finished:
+                return task
+        current = getcurrent()
+        callbacks = [
+            (task, task.ondone(self.switch_to, current, task))
+            for task in tasks]
+        try:
+            return self.pause(timeout=timeout)
+        finally:
+            for task, callback in callbacks:
+                if callback in task.callbacks:
+                    task.callbacks.remove(callback)
+
+    def wait_all(self, tasks, timeout=-1):
         """
-        self.ready.append((f, a))
+        Blocks until all of *tasks* have finished, either forever or until
+        *timeout* milliseconds, and returns *tasks*. The waiting green thread
+        is only woken once, when the last task finishes.
+        """
+        pending = [task for task in tasks if not task.finished]
+        if not pending:
+            return tasks
+        current = getcurrent()
+        remaining = [len(pending)]
+
+        def finished():
+            remaining[0] -= 1
+            if not remaining[0]:
+                self.switch_to(current)
+
+        callbacks = [(task, task.ondone(finished)) for task in pending]
+        try:
+            self.pause(timeout=timeout)
+        finally:
+            for task, callback in callbacks:
+                if callback in task.callbacks:
+                    task.callbacks.remove(callback)
+        return tasks
 
-    def spawn_later(self, ms, f, *a):
+    def spawn_later(self, ms, f, *a, **kw):
         """
         Spawns a callable on a new green thread, scheduled for *ms*
         milliseconds in the future::
@@ -357,10 +1310,26 @@ class Hub(object):
             p = h.pipe()
             h.spawn_later(50, echo, p, 'hi')
             p.recv() # returns 'hi' after 50ms
-        """
-        self.scheduled.add(ms, f, *a)
 
-    def sleep(self, ms=1):
+        A *priority* other than `NORMAL` queues the green thread on its ready
+        queue once it's due, see `spawn`.
+
+        Pass *slack* in milliseconds to override the Hub's default slack for
+        this timer::
+
+            h.spawn_later(1000, flush, slack=100)
+        """
+        priority = kw.pop('priority', self.NORMAL)
+        slack = kw.pop('slack', self.scheduled.slack)
+        if kw:
+            raise TypeError('unexpected keyword arguments: %s' % ', '.join(kw))
+        if priority == self.NORMAL:
+            self.scheduled.arm(ms, slack, f, a)
+        else:
+            # the timer's action is the ready queue itself, see run_timer
+            self.scheduled.arm(ms, slack, self.queues[priority], (f, a))
+
+    def sleep(self, ms=1, slack=None):
         """
         Pauses the current green thread for *ms* milliseconds::
 
@@ -374,41 +1343,107 @@ class Hub(object):
 
             p.recv() # returns '1'
             p.recv() # returns '2' after 50 ms
+
+        The green thread may sleep for up to *slack* milliseconds longer, which
+        defaults to the Hub's slack.
+        """
+        if slack is None:
+            item = self.scheduled.add(ms, getcurrent())
+        else:
+            item = self.scheduled.arm(ms, slack, getcurrent(), ())
+        try:
+            self.loop.switch()
+        except BaseException:
+            # something was thrown in, e.g. the task was cancelled, so don't
+            # leave the timer to wake us later
+            self.scheduled.remove(item)
+            raise
+
+    def watch(self, fd, *masks, **kw):
         """
-        self.scheduled.add(ms, getcurrent())
-        self.loop.switch()
+        Registers the file descriptor *fd* with the Hub's poller for *masks*
+        and returns a `Watch` which green threads can block on until *fd* is
+        ready::
 
-    def register(self, fd, *masks):
+            watch = h.watch(fileno, vanilla.poll.POLLIN)
+            while True:
+                watch.wait(vanilla.poll.POLLIN)
+                data = os.read(fileno, 4096)
+
+        Waiters are woken in the order of their Watch's *priority* when
+        several descriptors are ready at once, see `spawn`.
+
+        *fd* can also be waited on for masks other than *masks*, which are
+        only polled while they're waited on.
+
+        Pass *oneshot* as True to have the poller disarm *fd* each time it's
+        reported until it's next waited on. This suits a listening socket
+        which is shared between Hubs.
+        """
+        priority = kw.pop('priority', self.NORMAL)
+        oneshot = kw.pop('oneshot', False)
+        if kw:
+            raise TypeError('unexpected keyword arguments: %s' % ', '.join(kw))
+        watch = Watch(self, fd, masks, priority, oneshot=oneshot)
+        if priority != self.NORMAL:
+            self.prioritized += 1
+        self.registered[fd] = watch
+        self.poll.register(fd, *watch.interest(), oneshot=oneshot)
+        return watch
+
+    def register(self, fd, *masks, **kw):
+        """
+        Registers the file descriptor *fd* with the Hub's poller for *masks*
+        and returns a `Recver`_ for each mask, which is sent True whenever
+        *fd* becomes ready while the Recver is waiting.
+
+        This is a compatibility layer over `watch`: each Recver is fed by a
+        green thread blocked on the Watch, so `watch` should be prefered.
+        """
+        watch = self.watch(fd, *masks, **kw)
         ret = []
-        self.registered[fd] = {}
         for mask in masks:
             sender, recver = self.pipe()
-            self.registered[fd][mask] = sender
+            self.spawn(self.relay, watch, mask, sender)
             ret.append(recver)
-        self.poll.register(fd, *masks)
         if len(ret) == 1:
             return ret[0]
         return ret
 
+    def relay(self, watch, mask, sender):
+        while True:
+            try:
+                watch.wait(mask)
+                if sender.ready:
+                    sender.send(True)
+            except vanilla.exception.Halt, e:
+                sender.close(exception=e)
+                return
+
     def unregister(self, fd):
         if fd in self.registered:
-            masks = self.registered.pop(fd)
+            watch = self.registered.pop(fd)
+            if watch.priority != self.NORMAL:
+                self.prioritized -= 1
             try:
-                self.poll.unregister(fd, *(masks.keys()))
+                self.poll.unregister(fd, *watch.masks)
             except:
                 pass
-            for mask in masks:
-                masks[mask].close()
+            watch.close()
 
     def stop(self):
         self.sleep(1)
 
-        for fd, masks in self.registered.items():
-            for mask, sender in masks.items():
-                sender.stop()
+        for fd, watch in self.registered.items():
+            watch.stop()
 
         while self.scheduled:
             task, a = self.scheduled.pop()
+            if isinstance(task, Periodic):
+                # the timer's just been popped, so there's nothing to cancel
+                task.timer = None
+                task.stop()
+                continue
             self.throw_to(task, vanilla.exception.Stop('stop'))
 
         try:
@@ -425,25 +1460,110 @@ class Hub(object):
             if isinstance(task, greenlet):
                 task.switch(*a)
             else:
-                greenlet(task).switch(*a)
+                self.workers.run(task, a)
         except Exception, e:
             self.log.warn('Exception leaked back to main loop', exc_info=e)
 
-    def dispatch_events(self, events):
-        for fd, mask in events:
-            if fd in self.registered:
-                masks = self.registered[fd]
-                if mask == vanilla.poll.POLLERR:
-                    for sender in masks.values():
-                        sender.close()
-                else:
-                    if masks[mask].ready:
-                        masks[mask].send(True)
+    def run_timer(self, task, a, stats):
+        if isinstance(task, collections.deque):
+            # a prioritized spawn_later: the callable is queued straight on
+            # the ready queue for its priority, without running anything
+            task.append(a)
+        elif isinstance(task, Periodic):
+            # ticks are handled inline on the loop
+            if stats is not None:
+                stats.tasks += 1
+            task()
+        elif not a and getattr(task, 'priority', self.NORMAL) != self.NORMAL:
+            # a prioritized green thread waking from sleep goes back on the
+            # ready queue for its priority
+            self.queues[task.priority].append((task, a))
+        elif stats is not None:
+            stats.run(task, a)
+        else:
+            self.run_task(task, *a)
+
+    def dispatch_events(self, fds, masks, stats=None):
+        # this runs on the Hub's loop: green threads waiting on a ready
+        # descriptor are switched to directly. events come as the poller's
+        # parallel lists of fds and masks, which izip walks without
+        # allocating a tuple per event. the green threads switched to are
+        # counted as tasks in *stats*, before they run
+        if self.prioritized:
+            get = self.registered.get
+            order = sorted(
+                xrange(len(fds)),
+                key=lambda i: getattr(get(fds[i]), 'priority', 0))
+            fds = [fds[i] for i in order]
+            masks = [masks[i] for i in order]
+        for fd, mask in itertools.izip(fds, masks):
+            watch = self.registered.get(fd)
+            if watch is None:
+                continue
+            if mask == vanilla.poll.POLLERR:
+                if stats is not None and not watch.closed:
+                    stats.tasks += len(filter(None, watch.waiters.values()))
+                watch.error()
+                continue
+            waiter = watch.waiters.get(mask)
+            if waiter is not None:
+                if stats is not None:
+                    stats.tasks += 1
+                self.run_task(waiter, mask)
+            elif watch.level:
+                watch.disarm()
+
+    def drain(self, stats):
+        """
+        Runs a turn's worth of the ready queues, round robin from highest to
+        lowest priority and within the turn's `Budget`, if there is one.
+        Returns True if the budget ran out with tasks still ready.
+        """
+        if stats is not None:
+            stats.turn()
+        budget = self.budget
+        n = budget and budget.tasks or -1
+        # the turn started as the loop read the clock
+        start = self.time
+        deadline = budget and budget.ms and start + budget.ms / 1000.0
+        rounds = zip(self.queues, self.weights)
+        try:
+            while True:
+                ran = False
+                for priority, (queue, weight) in enumerate(rounds):
+                    # workers pick up the priority of the task they're given
+                    self.priority = priority
+                    while queue and weight:
+                        if not n:
+                            budget.exhausted += 1
+                            return True
+                        n -= 1
+                        weight -= 1
+                        ran = True
+                        task, a = queue.popleft()
+                        if stats is not None:
+                            stats.tasks += 1
+                        self.run_task(task, *a)
+                        if deadline and self.clock() >= deadline:
+                            if any(self.queues):
+                                budget.exhausted += 1
+                                return True
+                            return False
+                if not ran:
+                    return False
+        finally:
+            self.priority = self.NORMAL
+            if stats is not None:
+                stats.run_time += self.clock() - start
 
     def main(self):
         """
         Scheduler steps:
-            - run ready until exhaustion
+            - run the ready queues until exhaustion, or until the turn's
+              budget runs out
+
+            - if the budget ran out, run overdue scheduled, poll registered
+              without blocking and go back to ready
 
             - if there's something scheduled
                 - run overdue scheduled immediately
@@ -457,24 +1577,57 @@ class Hub(object):
               is scheduled
         """
 
+        urgent, ready, deferred = self.queues
+
         while True:
-            while self.ready:
-                task, a = self.ready.popleft()
-                self.run_task(task, *a)
+            self.time = self.clock()
+            stats = self.counters
+
+            exhausted = False
+            if self.budget is not None or urgent or deferred:
+                exhausted = self.drain(stats)
+            elif stats is not None:
+                stats.drain()
+            else:
+                while ready:
+                    task, a = ready.popleft()
+                    self.run_task(task, *a)
+                    if urgent:
+                        break
+
+            if exhausted:
+                # the turn's budget ran out: run what's overdue and check for
+                # I/O without blocking, then go back to the ready queue. the
+                # turn may have run for a while, so catch the time up first
+                self.time = self.clock()
+                for _ in xrange(len(self.scheduled)):
+                    if self.scheduled.timeout() >= 0:
+                        break
+                    task, a = self.scheduled.pop()
+                    self.run_timer(task, a, stats)
+                if not self.registered:
+                    continue
+                timeout = 0
+
+            elif urgent or ready or deferred:
+                # something was spawned on another ready queue while the
+                # normal one was run
+                continue
 
-            if self.scheduled:
+            elif self.scheduled:
                 timeout = self.scheduled.timeout()
                 # run overdue scheduled immediately
                 if timeout < 0:
                     task, a = self.scheduled.pop()
-                    self.run_task(task, *a)
+                    self.run_timer(task, a, stats)
                     continue
 
                 # if nothing registered, just sleep until next scheduled
                 if not self.registered:
+                    self.polling = True
                     time.sleep(timeout)
-                    task, a = self.scheduled.pop()
-                    self.run_task(task, *a)
+                    self.polling = False
+                    self.polls += 1
                     continue
             else:
                 timeout = -1
@@ -485,11 +1638,23 @@ class Hub(object):
                 return
 
             # run poll
-            events = None
+            n = 0
+            self.polling = True
             try:
-                events = self.poll.poll(timeout=timeout)
+                if stats is not None:
+                    n = stats.harvest(timeout)
+                else:
+                    n = self.poll.harvest(timeout)
             # IOError from a signal interrupt
             except IOError:
                 pass
-            if events:
-                self.spawn(self.dispatch_events, events)
+            self.polling = False
+            self.polls += 1
+            # poll may have blocked for a while, so the turn's time is stale
+            # for anything woken by the events
+            self.time = self.clock()
+            if n:
+                if stats is not None:
+                    stats.dispatch(self.poll.fds, self.poll.masks)
+                else:
+                    self.dispatch_events(self.poll.fds, self.poll.masks)
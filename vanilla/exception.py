@@ -18,6 +18,10 @@ class Abandoned(Halt):
     pass
 
 
+class Cancelled(Halt):
+    pass
+
+
 # TODO: think through HTTP Exceptions
 class ConnectionLost(Exception):
     pass
@@ -1,15 +1,10 @@
 import collections
 import functools
-import urlparse
 import logging
-import hashlib
 import base64
 import urllib
 import struct
-import json
 import time
-import uuid
-import ssl
 import os
 
 import vanilla.exception
@@ -33,6 +28,8 @@ class __plugin__(object):
     # TODO: hacking in convenience for example, still need to add test
     # TODO: ensure connection is closed after the get is done
     def get(self, uri, params=None, headers=None):
+        import urlparse
+
         parsed = urlparse.urlsplit(uri)
         conn = self.connect('%s://%s' % (parsed.scheme, parsed.netloc))
         return conn.get(parsed.path, params=params, headers=headers)
@@ -181,12 +178,15 @@ class HTTPClient(HTTPSocket):
             return ''.join(self.body)
 
         def json(self):
+            import json
             return json.loads(self.consume())
 
         def __repr__(self):
             return 'HTTPClient.Response(status=%r)' % (self.status,)
 
     def __init__(self, hub, url):
+        import urlparse
+
         self.hub = hub
 
         parsed = urlparse.urlsplit(url)
@@ -201,6 +201,7 @@ class HTTPClient(HTTPSocket):
         # TODO: this shouldn't block on the SSL handshake
         if parsed.scheme == 'https':
             # TODO: what a mess
+            import ssl
             conn = self.socket.sender.fd.conn
             conn = ssl.wrap_socket(conn)
             conn.setblocking(0)
@@ -342,6 +343,8 @@ class HTTPClient(HTTPSocket):
         return self.request('DELETE', path, params, headers, None)
 
     def websocket(self, path='/', params=None, headers=None):
+        import uuid
+
         key = base64.b64encode(uuid.uuid4().bytes)
 
         headers = headers or {}
@@ -412,6 +415,7 @@ class HTTPServer(HTTPSocket):
             if self.headers.get('Content-Type') != \
                     'application/x-www-form-urlencoded':
                 raise AttributeError('not a form encoded request')
+            import urlparse
             return dict(urlparse.parse_qsl(self.body))
 
         @property
@@ -419,6 +423,7 @@ class HTTPServer(HTTPSocket):
             if self.headers.get('Content-Type') != \
                     'application/x-www-form-urlencoded':
                 raise AttributeError('not a form encoded request')
+            import urlparse
             return urlparse.parse_qs(self.body)
 
         def consume(self):
@@ -511,6 +516,7 @@ class WebSocket(object):
 
     @staticmethod
     def accept_key(key):
+        import hashlib
         value = key + "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
         return base64.b64encode(hashlib.sha1(value).digest())
 
@@ -44,7 +44,7 @@ class FD_from_fileno_in(object):
         self.hub = hub
         self.fileno = fileno
         unblock(self.fileno)
-        self.pollin = hub.register(self.fileno, vanilla.poll.POLLIN)
+        self.watch = hub.watch(self.fileno, vanilla.poll.POLLIN)
 
     def read(self, n):
         return os.read(self.fileno, n)
@@ -62,7 +62,8 @@ class FD_from_fileno_out(object):
         self.hub = hub
         self.fileno = fileno
         unblock(self.fileno)
-        self.pollout = hub.register(self.fileno, vanilla.poll.POLLOUT)
+        # POLLOUT is only polled while a write is blocked, see Sender.send
+        self.watch = hub.watch(self.fileno)
 
     def write(self, data):
         return os.write(self.fileno, data)
@@ -82,8 +83,8 @@ class FD_from_socket(object):
         self.closed = False
         self.fileno = self.conn.fileno()
         unblock(self.fileno)
-        self.pollin, self.pollout = hub.register(
-            self.fileno, vanilla.poll.POLLIN, vanilla.poll.POLLOUT)
+        # POLLOUT is only polled while a write is blocked, see Sender.send
+        self.watch = hub.watch(self.fileno, vanilla.poll.POLLIN)
 
     def read(self, n):
         return self.conn.recv(n)
@@ -104,32 +105,30 @@ class Sender(object):
         self.fd = fd
         self.hub = fd.hub
 
-        self.gate = self.hub.router().pipe(self.hub.state())
-        self.fd.pollout.pipe(self.gate)
-        self.fd.pollout.onclose(self.close)
+        self.fd.watch.onclose(self.close)
+        # writes are serialized so a partial write isn't interleaved
+        self.lock = self.hub.lock()
 
-        @self.hub.serialize
-        def send(data, timeout=-1):
-            # TODO: test timeout
+    def send(self, data, timeout=-1):
+        # TODO: test timeout
+        with self.lock:
             while True:
                 try:
                     n = self.fd.write(data)
                 except (socket.error, OSError), e:
                     if e.errno == errno.EAGAIN:
-                        self.gate.clear().recv()
+                        self.fd.watch.wait(vanilla.poll.POLLOUT)
                         continue
                     self.close()
                     raise vanilla.exception.Closed()
                 if n == len(data):
                     break
                 data = data[n:]
-        self.send = send
 
     def connect(self, recver):
         recver.consume(self.send)
 
     def close(self):
-        self.gate.close()
         self.fd.close()
 
 
@@ -141,7 +140,12 @@ def Recver(fd):
 
     @hub.spawn
     def _():
-        for _ in fd.pollin:
+        while True:
+            try:
+                fd.watch.wait(vanilla.poll.POLLIN)
+            except vanilla.exception.Halt:
+                break
+
             while True:
                 try:
                     data = fd.read(16384)
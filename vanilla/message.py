@@ -13,6 +13,15 @@ class NoState(object):
     """a marker to indicate no state"""
 
 
+class NoItem(object):
+    """a marker to indicate no item is parked on a pipe"""
+
+
+# the kinds of stage fused by Recver.map and Recver.filter
+MAP = 'map'
+FILTER = 'filter'
+
+
 class Pair(Pair):
     """
     A Pair is a tuple of a `Sender`_ and a `Recver`_. The pair only share a
@@ -43,6 +52,13 @@ class Pair(Pair):
         """
         return self.sender.send(item, timeout=timeout)
 
+    def send_many(self, items, timeout=-1):
+        """
+        Send each of *items* on this pair; see
+        :meth:`vanilla.message.Sender.send_many`
+        """
+        return self.sender.send_many(items, timeout=timeout)
+
     def clear(self):
         self.sender.clear()
         return self
@@ -54,6 +70,13 @@ class Pair(Pair):
         """
         return self.recver.recv(timeout=timeout)
 
+    def recv_many(self, max_n, timeout=-1):
+        """
+        Receive up to *max_n* items from our Sender; see
+        :meth:`vanilla.message.Recver.recv_many`
+        """
+        return self.recver.recv_many(max_n, timeout=timeout)
+
     def recv_n(self, n, timeout=-1):
         return self.recver.recv_n(n, timeout=timeout)
 
@@ -80,6 +103,15 @@ class Pair(Pair):
         """
         return self._replace(recver=self.recver.map(f))
 
+    def filter(self, f):
+        """
+        Filters this Pair with *f*; see :meth:`vanilla.core.Recver.filter`
+
+        Returns a new Pair of our current Sender and the filtered target's
+        Recver.
+        """
+        return self._replace(recver=self.recver.filter(f))
+
     def consume(self, f):
         """
         Consumes this Pair with *f*; see :meth:`vanilla.core.Recver.consume`.
@@ -130,11 +162,26 @@ class Pipe(object):
         p = h.pipe()
         h.spawn(p.send, 1)
         p.recv()      # returns 1
+
+    The Pipe itself is the middle object the two ends share. It holds all of
+    the pair's state, and like the ends it uses __slots__, as pipes are
+    created for every stage of a pipeline and every connection.
     """
+    __slots__ = (
+        'hub', 'closed', 'closers', 'parked', 'batch', 'buffer', 'size',
+        'sender', 'sender_current', 'recver', 'recver_current')
+
     def __new__(cls, hub):
         self = super(Pipe, cls).__new__(cls)
         self.hub = hub
         self.closed = False
+        # the item of a send blocked waiting for a recver, see Sender.park,
+        # or the deque of items of a blocked send_many
+        self.parked = NoItem
+        self.batch = None
+        # a deque of up to size items for a buffered pipe, see Queue
+        self.buffer = None
+        self.size = 0
 
         recver = Recver(self)
         self.recver = weakref.ref(recver, self.on_abandoned)
@@ -158,6 +205,14 @@ class Pipe(object):
 
 
 class End(object):
+    # subclasses are swapped in by assigning __class__, e.g. by Dealer and
+    # Stream, so they can't add slots of their own: any attributes they need
+    # are declared here. __dict__ is only allocated if an end has an ad hoc
+    # attribute set, such as tcp.listen's port.
+    __slots__ = (
+        'middle', 'upstream', 'downstream', 'extra', 'sep', 'stages',
+        '__weakref__', '__dict__')
+
     def __init__(self, pipe):
         self.middle = pipe
 
@@ -185,6 +240,18 @@ class End(object):
         assert self.current == getcurrent()
         self.current = None
 
+    def enroll(self, token):
+        # registers a `Selector`'s token as this end's waiter until unenroll.
+        # returns False if the end can't hold a token and needs to be
+        # selected for each wait instead
+        assert self.current is None
+        self.current = token
+        return True
+
+    def unenroll(self, token):
+        if self.current is token:
+            self.current = None
+
     def abandoned(self):
         if self.current:
             self.hub.throw_to(self.current, vanilla.exception.Abandoned)
@@ -228,6 +295,12 @@ class End(object):
 
 
 class Sender(End):
+    __slots__ = ()
+
+    # whether a blocked send can leave its item on the pipe. only possible
+    # when there's a single sender
+    parks = True
+
     @property
     def current(self):
         return self.middle.sender_current
@@ -240,21 +313,151 @@ class Sender(End):
     def other(self):
         return self.middle.recver()
 
+    @property
+    def ready(self):
+        middle = self.middle
+        if middle.closed:
+            raise vanilla.exception.Closed
+        other = middle.recver()
+        if other is None:
+            raise vanilla.exception.Abandoned
+        if other.current:
+            return True
+        # or there's room in the buffer
+        buffer = middle.buffer
+        return buffer is not None and len(buffer) < middle.size
+
     def send(self, item, timeout=-1):
         """
         Send an *item* on this pair. This will block unless our Rever is ready,
         either forever or until *timeout* milliseconds.
         """
+        if self.middle.buffer is not None:
+            return self.enqueue(item, timeout)
+
         if not self.ready:
+            if timeout == -1 and self.parks:
+                return self.park(item)
             self.pause(timeout=timeout)
 
+        other = self.middle.recver()
         if isinstance(item, Exception):
-            return self.hub.throw_to(self.other.peak, item)
+            return self.hub.throw_to(other.peak, item)
 
-        return self.hub.switch_to(self.other.peak, self.other, item)
+        return self.hub.switch_to(other.peak, other, item)
+
+    def enqueue(self, item, timeout):
+        # sends on a buffered pipe: straight to a waiting recver, otherwise on
+        # to the buffer, only blocking while it's full
+        while not self.ready:
+            if timeout == -1 and self.parks:
+                # the recver moves our item on to the buffer as it makes room
+                return self.park(item)
+            self.pause(timeout=timeout)
+
+        middle = self.middle
+        other = middle.recver()
+        if other.current:
+            if isinstance(item, Exception):
+                return self.hub.throw_to(other.peak, item)
+            return self.hub.switch_to(other.peak, other, item)
+        middle.buffer.append(item)
+
+    def send_many(self, items, timeout=-1):
+        """
+        Sends each of *items* in order, as for *send*. Rather than a
+        rendezvous per item, whatever can't be delivered straight away is
+        parked on the pipe in one go, for the recver to take as fast as it
+        likes, e.g. with *recv_many*. This blocks until all of *items* have
+        been taken.
+        """
+        batch = collections.deque(items)
+        if timeout != -1 or not self.parks:
+            for item in batch:
+                self.send(item, timeout=timeout)
+            return
+
+        middle = self.middle
+        buffer = middle.buffer
+        while batch:
+            if not self.ready:
+                return self.park_many(batch)
+            other = middle.recver()
+            if not other.current:
+                # there's room in the buffer
+                while batch and len(buffer) < middle.size:
+                    buffer.append(batch.popleft())
+                continue
+            item = batch.popleft()
+            if buffer is not None:
+                # a recver's only waiting if the buffer's empty
+                while batch and len(buffer) < middle.size:
+                    buffer.append(batch.popleft())
+            if batch and other.drains and not isinstance(item, Exception):
+                # switch to the recver without queueing ourselves, and leave
+                # it to take the rest
+                return self.park_many(batch, (other.peak, other, item))
+            self.send(item)
+
+    def park_many(self, batch, switch=None):
+        middle = self.middle
+        current = getcurrent()
+        middle.batch = batch
+        middle.sender_current = current
+        try:
+            if switch is None:
+                self.hub.pause()
+            else:
+                target, other, item = switch
+                target.switch(other, item)
+        finally:
+            if middle.sender_current is current:
+                # woken before the whole batch was taken, e.g. closed
+                middle.sender_current = None
+                middle.batch = None
+
+    def unpark(self):
+        # a parked send has been taken in full, so queue it to resume
+        middle = self.middle
+        waiter = middle.sender_current
+        middle.sender_current = None
+        middle.parked = NoItem
+        middle.batch = None
+        self.hub.wake(waiter)
+
+    def park(self, item):
+        # blocks with *item* left on the pipe. the recver takes it in
+        # handover and queues us to resume, rather than switching to us just
+        # to have us switch straight back with the item
+        middle = self.middle
+        current = getcurrent()
+        middle.parked = item
+        middle.sender_current = current
+        try:
+            self.hub.pause()
+        finally:
+            if middle.sender_current is current:
+                # woken without the item being taken, e.g. closed
+                middle.sender_current = None
+                middle.parked = NoItem
 
     def handover(self, recver):
         assert recver.ready
+        middle = self.middle
+        batch = middle.batch
+        if batch is not None:
+            item = batch.popleft()
+            if not batch:
+                self.unpark()
+            if isinstance(item, Exception):
+                raise item
+            return item
+        item = middle.parked
+        if item is not NoItem:
+            self.unpark()
+            if isinstance(item, Exception):
+                raise item
+            return item
         recver.select()
         # switch directly, as we need to pause
         _, ret = recver.other.peak.switch(recver.other, None)
@@ -271,6 +474,12 @@ class Sender(End):
         To:
             s1 -> m1 <- r2
         """
+        if self.middle.buffer is not None:
+            # our buffer lives on m2, so r1 is fed into it instead
+            recver.onclose(self.close)
+            recver.consume(self.send)
+            return self.other
+
         r1 = recver
         m1 = r1.middle
         s2 = self
@@ -297,6 +506,13 @@ class Sender(End):
 
 
 class Recver(End):
+    __slots__ = ()
+
+    # whether a waiting recver can be left to take the rest of a batch it's
+    # handed the first item of, see Sender.send_many. not when there are
+    # other recvers who could be waiting too
+    drains = True
+
     @property
     def current(self):
         return self.middle.recver_current
@@ -309,16 +525,86 @@ class Recver(End):
     def other(self):
         return self.middle.sender()
 
+    @property
+    def ready(self):
+        middle = self.middle
+        # buffered items can still be received once the sender's gone
+        if middle.buffer:
+            return True
+        if middle.closed:
+            raise vanilla.exception.Closed
+        other = middle.sender()
+        if other is None:
+            raise vanilla.exception.Abandoned
+        return bool(other.current)
+
+    @property
+    def halted(self):
+        return not self.middle.buffer and super(Recver, self).halted
+
     def recv(self, timeout=-1):
         """
         Receive and item from our Sender. This will block unless our Sender is
         ready, either forever or unless *timeout* milliseconds.
         """
+        if self.middle.buffer:
+            return self.unbuffer()
+
         if self.ready:
             return self.other.handover(self)
 
         return self.pause(timeout=timeout)
 
+    def unbuffer(self):
+        middle = self.middle
+        item = middle.buffer.popleft()
+        other = middle.sender()
+        if other is not None and other.current:
+            # a sender is waiting for room
+            buffer = middle.buffer
+            batch = middle.batch
+            if batch is not None:
+                while batch and len(buffer) < middle.size:
+                    buffer.append(batch.popleft())
+                if not batch:
+                    other.unpark()
+            elif middle.parked is not NoItem:
+                buffer.append(middle.parked)
+                other.unpark()
+            else:
+                self.hub.switch_to(other.peak, other, None)
+        if isinstance(item, Exception):
+            raise item
+        return item
+
+    def recv_many(self, max_n, timeout=-1):
+        """
+        Blocks until at least one item is available, as for *recv*, and then
+        returns a list of up to *max_n* items, taking as many as are available
+        without blocking further. An item which is an exception is only ever
+        raised on its own, so the items before it are returned first.
+        """
+        items = [self.recv(timeout=timeout)]
+        middle = self.middle
+        while len(items) < max_n:
+            if middle.buffer:
+                if isinstance(middle.buffer[0], Exception):
+                    break
+                items.append(self.unbuffer())
+                continue
+            if middle.closed:
+                break
+            if middle.batch:
+                following = middle.batch[0]
+            elif middle.parked is not NoItem:
+                following = middle.parked
+            else:
+                break
+            if isinstance(following, Exception):
+                break
+            items.append(self.other.handover(self))
+        return items
+
     def __iter__(self):
         while True:
             try:
@@ -326,6 +612,17 @@ class Recver(End):
             except vanilla.exception.Halt:
                 break
 
+    def iter_many(self, max_n):
+        """
+        As iterating over the Recver, but yields lists of up to *max_n* items
+        at a time, see *recv_many*.
+        """
+        while True:
+            try:
+                yield self.recv_many(max_n)
+            except vanilla.exception.Halt:
+                break
+
     def pipe(self, target):
         """
         Pipes this Recver to *target*. *target* can either be `Sender`_ (or
@@ -398,14 +695,71 @@ class Recver(End):
 
             h.spawn(sender.send, 2)
             recver.recv() # returns 4
+
+        If *f* raises, the exception is sent on in place of the value.
+
+        A run of *map* and *filter* stages shares a single green thread and
+        `Pipe`_, which applies each stage in turn, rather than there being one
+        of each per stage. A run is only split by the other ways of piping a
+        Recver, or if the stage is added while the run is blocked sending.
+        Adding a stage to a run always returns a new Recver: as when piping to
+        a `Sender`_, the Recver the stage was added to is spent.
         """
+        return self.fuse(MAP, f)
+
+    def filter(self, f):
+        """
+        *f* is a callable that takes a single argument. Only the values sent on
+        this Recver's Sender for which *f* returns true are passed on::
+
+            sender, recver = h.pipe()
+            recver = recver.filter(lambda i: i % 2)
+
+            h.spawn(sender.send_many, [1, 2, 3])
+            recver.recv() # returns 1
+            recver.recv() # returns 3
+
+        As for *map*, a run of *map* and *filter* stages is fused.
+        """
+        return self.fuse(FILTER, f)
+
+    def fuse(self, kind, f):
+        # adds a stage to the run feeding this Recver if there is one, so long
+        # as no item is on its way through the run's sender. the run's pipe is
+        # handed on to a new Recver, and as when a Recver is piped to a
+        # Sender, this one is spent
+        stages = getattr(self, 'stages', None)
+        if stages is not None:
+            other = self.other
+            if other is not None and not other.current and \
+                    not self.current and not self.middle.closed:
+                stages.append((kind, f))
+                middle = self.middle
+                recver = Recver(middle)
+                recver.stages = stages
+                del middle.recver
+                middle.recver = weakref.ref(recver, middle.on_abandoned)
+                self.stages = None
+                del self.middle
+                return recver
+
+        stages = [(kind, f)]
+
         @self.pipe
         def recver(recver, sender):
             for item in recver:
                 try:
-                    sender.send(f(item))
+                    for kind, f in stages:
+                        if kind is MAP:
+                            item = f(item)
+                        elif not f(item):
+                            break
+                    else:
+                        sender.send(item)
                 except Exception, e:
                     sender.send(e)
+
+        recver.stages = stages
         return recver
 
     def consume(self, f):
@@ -434,6 +788,139 @@ class Recver(End):
                     self.close()
                     break
 
+    def consume_many(self, f, max_n):
+        """
+        As *consume*, but *f* is passed lists of up to *max_n* items at a
+        time, see *recv_many*::
+
+            def insert(rows):
+                db.insert(rows)
+
+            recver.consume_many(insert, 100)
+        """
+        @self.hub.spawn
+        def _():
+            for items in self.iter_many(max_n):
+                try:
+                    f(items)
+                except vanilla.exception.Halt:
+                    self.close()
+                    break
+
+
+class Selector(object):
+    """
+    A Selector is a reusable `select`_ over a set of *ends* which changes
+    little from one wait to the next. Ends are registered with the Selector
+    once, and stay registered across waits, rather than being selected and
+    unselected on every call::
+
+        selector = h.selector([upstream, downstream])
+        while True:
+            end, item = selector.wait()
+
+    Ends can be added and removed as they come and go. When more than one end
+    is ready at the start of a wait, the end after the last one reported is
+    preferred, so a busy end can't starve the others.
+
+    A registered end should only be used directly once it's been reported
+    ready, or after it's been removed.
+    """
+    class Token(object):
+        # stands in for the waiting green thread on registered ends. it's only
+        # truthy while the Selector is waiting, so counterparts only see its
+        # ends as ready then
+        def __init__(self, selector):
+            self.selector = selector
+
+        def __nonzero__(self):
+            return self.selector.waiter is not None
+
+        def switch(self, *a):
+            return self.selector.waiter.switch(*a)
+
+        def throw(self, *a):
+            return self.selector.waiter.throw(*a)
+
+    def __init__(self, hub, ends=()):
+        self.hub = hub
+        self.ends = []
+        self.tokens = {}
+        # ends which can't hold a token and are selected for each wait
+        self.transient = []
+        self.waiter = None
+        self.offset = 0
+        for end in ends:
+            self.add(end)
+
+    def __len__(self):
+        return len(self.ends)
+
+    def __contains__(self, end):
+        return end in self.tokens
+
+    def add(self, end):
+        if end in self.tokens:
+            return
+        token = self.Token(self)
+        if not end.enroll(token):
+            token = None
+            self.transient.append(end)
+        self.tokens[end] = token
+        self.ends.append(end)
+
+    def remove(self, end):
+        if end not in self.tokens:
+            return
+        token = self.tokens.pop(end)
+        self.ends.remove(end)
+        if token is None:
+            self.transient.remove(end)
+        else:
+            end.unenroll(token)
+
+    def clear(self):
+        for end in list(self.ends):
+            self.remove(end)
+
+    def take(self, end):
+        # receives from a registered recver whose sender is already waiting
+        if not isinstance(end, Recver):
+            return None
+        token = self.tokens[end]
+        if token is None:
+            return end.recv()
+        end.current = None
+        try:
+            return end.recv()
+        finally:
+            end.current = token
+
+    def wait(self, timeout=-1):
+        """
+        Blocks until one of the registered ends is ready, either forever or
+        until *timeout* milliseconds. Returns a tuple of (*end*, *value*), as
+        for `select`_.
+        """
+        ends = self.ends
+        n = len(ends)
+        for i in xrange(n):
+            index = (self.offset + i) % n
+            end = ends[index]
+            if end.ready:
+                self.offset = index + 1
+                return end, self.take(end)
+
+        for end in self.transient:
+            end.select()
+        self.waiter = getcurrent()
+        try:
+            return self.hub.pause(timeout=timeout)
+        finally:
+            self.waiter = None
+            for end in self.transient:
+                end.unselect()
+
 
 def Queue(hub, size):
     """
@@ -454,58 +941,75 @@ def Queue(hub, size):
         # q.send(1)    # this would deadlock however as the queue only has a
                        # buffer size of 1
         q.recv()       # returns 1
+
+    A Queue is a `Pipe`_ with a buffer on its middle. Sends go straight to a
+    waiting recver, or on to the buffer, and recvs take straight from the
+    buffer, so there's no green thread in between. Once the sender is closed,
+    the recver still receives what's buffered before Closed is raised.
     """
     assert size > 0
+    sender, recver = Pipe(hub)
+    sender.middle.buffer = collections.deque()
+    sender.middle.size = size
+    return Pair(sender, recver)
 
-    def main(upstream, downstream, size):
-        queue = collections.deque()
-
-        while True:
-            if downstream.halted:
-                # no one is downstream, so shutdown
-                upstream.close()
-                return
-
-            watch = []
-            if queue:
-                watch.append(downstream)
-            else:
-                # if the buffer is empty, and no one is upstream, shutdown
-                if upstream.halted:
-                    downstream.close()
-                    return
-
-            # if are upstream is still available, and there is spare room in
-            # the buffer, watch upstream as well
-            if not upstream.halted and len(queue) < size:
-                watch.append(upstream)
-
-            try:
-                ch, item = hub.select(watch)
-            except vanilla.exception.Halt:
-                continue
-
-            if ch == upstream:
-                queue.append(item)
 
-            elif ch == downstream:
-                item = queue.popleft()
-                downstream.send(item)
+class Waiters(object):
+    """
+    The green threads waiting on the shared end of a `Dealer`_ or `Router`_,
+    first come first served.
+
+    Removing a waiter, as happens when a select returns or a recv times out,
+    only forgets it: its entry is dropped once it reaches the front of the
+    queue, and the queue is compacted if stale entries come to outnumber the
+    live ones. So adding and removing waiters, and finding the first, are all
+    O(1), however many green threads are waiting.
+    """
+    __slots__ = ('queue', 'live', 'seq')
 
-    upstream = hub.pipe()
-    downstream = hub.pipe()
+    def __init__(self):
+        self.queue = collections.deque()
+        # waiter -> the seq of its live entry in queue
+        self.live = {}
+        self.seq = 0
 
-    # TODO: rethink this
-    old_connect = upstream.sender.connect
+    def __len__(self):
+        return len(self.live)
 
-    def connect(recver):
-        old_connect(recver)
-        return downstream.recver
+    def __nonzero__(self):
+        return bool(self.live)
 
-    upstream.sender.connect = connect
+    def __contains__(self, waiter):
+        return waiter in self.live
 
-    hub.spawn(main, upstream.recver, downstream.sender, size)
-    return Pair(upstream.sender, downstream.recver)
+    def __iter__(self):
+        live = self.live
+        return (
+            waiter for seq, waiter in list(self.queue)
+            if live.get(waiter) == seq)
+
+    def append(self, waiter):
+        self.seq += 1
+        self.live[waiter] = self.seq
+        self.queue.append((self.seq, waiter))
+
+    def remove(self, waiter):
+        del self.live[waiter]
+        if not self.live:
+            self.queue.clear()
+        elif len(self.queue) > 2 * len(self.live) + 16:
+            live = self.live
+            self.queue = collections.deque(
+                (seq, waiter) for seq, waiter in self.queue
+                if live.get(waiter) == seq)
+
+    def first(self):
+        queue, live = self.queue, self.live
+        while True:
+            seq, waiter = queue[0]
+            if live.get(waiter) == seq:
+                return waiter
+            queue.popleft()
 
 
 class Dealer(object):
@@ -530,6 +1034,10 @@ class Dealer(object):
         d.send(2)
     """
     class Recver(Recver):
+        __slots__ = ()
+
+        drains = False
+
         def select(self):
             assert getcurrent() not in self.current
             self.current.append(getcurrent())
@@ -539,7 +1047,11 @@ class Dealer(object):
 
         @property
         def peak(self):
-            return self.current[0]
+            return self.current.first()
+
+        def enroll(self, token):
+            # any waiter makes us ready, so we're selected for each wait
+            return False
 
         def abandoned(self):
             waiters = list(self.current)
@@ -549,7 +1061,7 @@ class Dealer(object):
     def __new__(cls, hub):
         sender, recver = hub.pipe()
         recver.__class__ = Dealer.Recver
-        recver.current = collections.deque()
+        recver.current = Waiters()
         return Pair(sender, recver)
 
 
@@ -575,6 +1087,11 @@ class Router(object):
         r.recv() # returns 1
     """
     class Sender(Sender):
+        __slots__ = ()
+
+        # many senders share the pipe, so they can't park their items on it
+        parks = False
+
         def select(self):
             assert getcurrent() not in self.current
             self.current.append(getcurrent())
@@ -584,7 +1101,11 @@ class Router(object):
 
         @property
         def peak(self):
-            return self.current[0]
+            return self.current.first()
+
+        def enroll(self, token):
+            # any waiter makes us ready, so we're selected for each wait
+            return False
 
         def abandoned(self):
             waiters = list(self.current)
@@ -598,22 +1119,98 @@ class Router(object):
     def __new__(cls, hub):
         sender, recver = hub.pipe()
         sender.__class__ = Router.Sender
-        sender.current = collections.deque()
+        sender.current = Waiters()
         return Pair(sender, recver)
 
 
+def Channel(hub, size=-1):
+    # a Router's Sender and a Dealer's Recver sharing one middle, which is
+    # buffered if *size* is positive, see `Hub.channel`
+    if size > 0:
+        sender, recver = Queue(hub, size)
+    else:
+        sender, recver = hub.pipe()
+    sender.__class__ = Router.Sender
+    sender.current = Waiters()
+    recver.__class__ = Dealer.Recver
+    recver.current = Waiters()
+    return Pair(sender, recver)
+
+
+# what a Broadcast does with an item for a subscriber which has fallen
+# behind, see Broadcast
+BLOCK = 'block'
+DROP_OLDEST = 'drop_oldest'
+DROP_NEWEST = 'drop_newest'
+DISCONNECT = 'disconnect'
+
+
 class Broadcast(object):
-    def __init__(self, hub):
+    """
+    ::
+
+                                 /--> recv
+        send --> Broadcast -----+---> recv
+                                 \--> recv
+
+    A Broadcast sends each item to all of its subscribers. Each subscriber is
+    a `Pipe`_, or a `Queue`_ if there's a *size*, and *policy* says what
+    happens when a subscriber can't take an item straight away:
+
+    - BLOCK waits for it, so one slow subscriber holds up the rest. This is
+      the default.
+    - DROP_OLDEST drops the oldest item in its buffer to make room.
+    - DROP_NEWEST drops the item being sent.
+    - DISCONNECT closes it. It still receives what's buffered first.
+
+    With any policy other than BLOCK, sends never block. Either can be set
+    for a subscriber when it subscribes::
+
+        b = h.broadcast(size=10, policy=vanilla.message.DROP_OLDEST)
+        fast = b.subscribe()
+        slow = b.subscribe(size=100, policy=vanilla.message.DISCONNECT)
+
+    Each subscriber's *lag* is the number of items it has missed, and the
+    Broadcast's *lag* is the total across all of its subscribers.
+    """
+    def __init__(self, hub, size=None, policy=BLOCK):
         self.hub = hub
+        self.size = size
+        self.policy = policy
         self.subscribers = []
         self.emptiers = []
+        self.lag = 0
 
     def onempty(self, f, *a, **kw):
         self.emptiers.append((f, a, kw))
 
     def send(self, item):
-        for subscriber in self.subscribers:
-            subscriber.send(item)
+        for subscriber in self.subscribers[:]:
+            if subscriber.policy == BLOCK:
+                subscriber.send(item)
+            else:
+                self.offer(subscriber, item)
+
+    def offer(self, subscriber, item):
+        # sends to a subscriber without blocking, applying its policy if it
+        # has no room
+        try:
+            if subscriber.ready:
+                return subscriber.send(item)
+        except vanilla.exception.Closed:
+            # it's already unsubscribed
+            return
+        except vanilla.exception.Abandoned:
+            return subscriber.close()
+
+        subscriber.other.lag += 1
+        self.lag += 1
+        if subscriber.policy == DROP_OLDEST:
+            buffer = subscriber.middle.buffer
+            buffer.popleft()
+            buffer.append(item)
+        elif subscriber.policy == DISCONNECT:
+            subscriber.close()
 
     def unsubscribe(self, sender):
         self.subscribers.remove(sender)
@@ -623,8 +1220,25 @@ class Broadcast(object):
             for f, a, kw in emptiers:
                 f(*a, **kw)
 
-    def subscribe(self):
-        sender, recver = self.hub.pipe()
+    def subscribe(self, size=None, policy=None):
+        """
+        Returns a new subscriber's `Recver`_. *size* and *policy* default to
+        the Broadcast's.
+        """
+        if size is None:
+            size = self.size
+        if policy is None:
+            policy = self.policy
+        assert policy in (BLOCK, DROP_OLDEST, DROP_NEWEST, DISCONNECT)
+        # only BLOCK can do without a buffer
+        assert size or policy == BLOCK
+
+        if size:
+            sender, recver = Queue(self.hub, size)
+        else:
+            sender, recver = self.hub.pipe()
+        sender.policy = policy
+        recver.lag = 0
         recver.onclose(self.unsubscribe, sender)
         self.subscribers.append(sender)
         return recver
@@ -670,6 +1284,11 @@ class State(object):
             return self.state != NoState
 
     class Sender(Sender):
+        __slots__ = ()
+
+        # sends never block
+        parks = False
+
         def init_state(self, item):
             self.current = State.G(self.hub, item)
 
@@ -694,6 +1313,129 @@ class State(object):
         return Pair(sender, recver)
 
 
+class Value(object):
+    """
+    A Value holds the latest of a series of items, along with its version,
+    which counts the sends so far::
+
+        v = h.value()
+        v.send('a')                 # sends never block
+        v.recv()                    # 'a', recvs only block until it's set
+
+        version, item = v.watch(0)  # (1, 'a')
+        v.watch(version)            # blocks until the next send
+
+    Any number of green threads can wait on a Value. A send queues them all
+    to be resumed together on the Hub's next pass, rather than switching to
+    each in turn, and there's no `Pipe`_ per waiter.
+
+    Items aren't queued, so a waiter which falls behind skips straight to
+    the latest version. As long as it passes back the last version it saw,
+    it never misses a send made while it was busy and never sees the same
+    version twice. Iterating over a Value does this for you::
+
+        for item in v:
+            ...
+
+    Once the Value is closed, waiters are woken and raise Closed, and
+    iterating stops.
+    """
+    def __init__(self, hub, item=NoState):
+        self.hub = hub
+        self.item = None
+        self.version = 0
+        self.closed = False
+        self.waiters = Waiters()
+        if item is not NoState:
+            self.item = item
+            self.version = 1
+
+    def send(self, item):
+        if self.closed:
+            raise vanilla.exception.Closed
+        self.item = item
+        self.version += 1
+        self.wake()
+
+    def wake(self):
+        waiters, self.waiters = self.waiters, Waiters()
+        for waiter in waiters:
+            self.hub.wake(waiter)
+
+    def close(self):
+        self.closed = True
+        self.wake()
+
+    def recv(self, timeout=-1):
+        """
+        Returns the latest item, blocking until the Value has been set either
+        forever or until *timeout* milliseconds.
+        """
+        return self.watch(0, timeout=timeout)[1]
+
+    def watch(self, version, timeout=-1):
+        """
+        Returns a tuple of the latest (*version*, *item*) once there's a
+        version newer than *version*, blocking either forever or until
+        *timeout* milliseconds.
+        """
+        if self.version <= version:
+            if self.closed:
+                raise vanilla.exception.Closed
+            self.wait(timeout)
+            if self.version <= version:
+                raise vanilla.exception.Closed
+        return self.version, self.item
+
+    def wait(self, timeout):
+        current = getcurrent()
+        self.waiters.append(current)
+        try:
+            self.hub.pause(timeout=timeout)
+        except vanilla.exception.Timeout:
+            if current in self.waiters:
+                self.waiters.remove(current)
+                raise
+            # we were woken just as we timed out, so take the queued wake up
+            # and carry on as woken
+            self.hub.pause()
+        except BaseException:
+            if current in self.waiters:
+                self.waiters.remove(current)
+            else:
+                self.hub.pause()
+            raise
+
+    def __iter__(self):
+        version = 0
+        while True:
+            try:
+                version, item = self.watch(version)
+            except vanilla.exception.Closed:
+                return
+            yield item
+
+
+class Pulse(object):
+    """
+    Pulse is a specialized `Pipe`_ which is fed by a `Periodic` timer rather
+    than a green thread, see `Hub.pulse`. When ticks are held for the Recver,
+    it's ready and recvs don't block.
+    """
+    class Sender(Sender):
+        __slots__ = ()
+
+        def handover(self, recver):
+            assert recver.ready
+            return self.current.take()
+
+    def __new__(cls, hub, timer):
+        sender, recver = hub.pipe()
+        sender.__class__ = Pulse.Sender
+        sender.current = timer
+        return Pair(sender, recver)
+
+
 class Stream(object):
     """
     A `Stream`_ is a specialized `Recver`_ which provides additional methods
@@ -701,6 +1443,8 @@ class Stream(object):
     descriptors.
     """
     class Recver(Recver):
+        __slots__ = ()
+
         def recv(self, timeout=-1):
             if self.extra:
                 extra = self.extra
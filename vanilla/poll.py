@@ -1,6 +1,44 @@
+"""
+Poller backends. Each backend has the same interface:
+
+- register(fd, \*masks, oneshot=False): start watching *fd* for *masks*
+- modify(fd, \*masks): change the masks *fd* is watched for
+- unregister(fd, \*masks): stop watching *fd*
+- harvest(timeout=-1): block for up to *timeout* seconds, forever if -1,
+  and collect the events which are ready into the parallel lists *fds* and
+  *masks*, returning how many there are
+- poll(timeout=-1): as harvest, but return a list of (fd, mask) events
+
+Errors and hangups are always reported, as POLLERR, whatever the masks.
+Backends track the current masks for each descriptor, so `modify` only goes
+to the kernel when they actually change. A *oneshot* descriptor is disarmed
+once it's been reported, until it's rearmed with `modify`, even with
+unchanged masks.
+
+At most *maxevents* events are collected per harvest. *fds* and *masks* are
+reused by each harvest, so the Hub's loop can dispatch a batch of events
+without allocating anything per event.
+
+*edge* is True for backends which only report a descriptor when it becomes
+ready, and False for level triggered backends, which report a descriptor for
+as long as it stays ready. With a level triggered backend, the Hub only
+polls a descriptor for the masks green threads are waiting on, see `Watch`,
+so one which is ready with no one waiting doesn't keep the loop spinning.
+
+`backends` maps names to the backends available on this platform, and `Poll`
+is the default, see `Hub`.
+"""
+
+import collections
+import ctypes.util
 import operator
+import ctypes
 import select
 import errno
+import math
+import mmap
+import sys
+import os
 
 
 POLLIN = 1
@@ -8,9 +46,83 @@ POLLOUT = 2
 POLLERR = 3
 
 
+backends = collections.OrderedDict()
+
+
+def bits(masks):
+    return reduce(operator.or_, masks, 0)
+
+
+class Poller(object):
+    """
+    Base for the backends, which tracks the masks registered for each
+    descriptor. Backends implement *add*, *change* and *remove*, which are
+    only called when the kernel needs to be told something, and *harvest*,
+    which calls `fired` once it has collected its events.
+    """
+    edge = True
+
+    def __init__(self, maxevents=1024):
+        self.maxevents = maxevents
+        self.fds = []
+        self.masks = []
+        # fd -> bits of the masks it's watched for
+        self.interest = {}
+        self.oneshot = set()
+        # oneshot descriptors which have been reported and are disarmed
+        self.disarmed = set()
+
+    def register(self, fd, *masks, **kw):
+        oneshot = kw.pop('oneshot', False)
+        if kw:
+            raise TypeError('unexpected keyword arguments: %s' % ', '.join(kw))
+        if fd in self.interest:
+            raise IOError(errno.EEXIST, os.strerror(errno.EEXIST))
+        self.interest[fd] = bits(masks)
+        if oneshot:
+            self.oneshot.add(fd)
+        self.add(fd, self.interest[fd], oneshot)
+
+    def modify(self, fd, *masks):
+        new = bits(masks)
+        old = self.interest.get(fd)
+        if old is None:
+            raise IOError(errno.ENOENT, os.strerror(errno.ENOENT))
+        if fd in self.disarmed:
+            self.disarmed.discard(fd)
+            old = 0
+        elif new == old:
+            return
+        self.interest[fd] = new
+        self.change(fd, old, new, fd in self.oneshot)
+
+    def unregister(self, fd, *masks):
+        old = self.interest.pop(fd, None)
+        if old is None:
+            raise IOError(errno.ENOENT, os.strerror(errno.ENOENT))
+        if fd in self.disarmed:
+            old = 0
+        try:
+            self.remove(fd, old)
+        finally:
+            self.oneshot.discard(fd)
+            self.disarmed.discard(fd)
+
+    def fired(self):
+        if self.oneshot:
+            for fd in self.fds:
+                if fd in self.oneshot:
+                    self.disarmed.add(fd)
+
+    def poll(self, timeout=-1):
+        self.harvest(timeout)
+        return zip(self.fds, self.masks)
+
+
 if hasattr(select, 'kqueue'):
-    class Poll(object):
-        def __init__(self):
+    class Kqueue(Poller):
+        def __init__(self, maxevents=1024):
+            super(Kqueue, self).__init__(maxevents)
             self.q = select.kqueue()
 
             self.to_ = {
@@ -19,46 +131,74 @@ if hasattr(select, 'kqueue'):
 
             self.from_ = dict((v, k) for k, v in self.to_.iteritems())
 
-        def register(self, fd, *masks):
-            for mask in masks:
-                event = select.kevent(
-                    fd,
-                    filter=self.from_[mask],
-                    flags=select.KQ_EV_ADD | select.KQ_EV_CLEAR)
-                self.q.control([event], 0)
+        def add(self, fd, new, oneshot):
+            self.change(fd, 0, new, oneshot)
+
+        def change(self, fd, old, new, oneshot):
+            flags = select.KQ_EV_ADD | select.KQ_EV_CLEAR
+            if oneshot:
+                flags |= select.KQ_EV_ONESHOT
+            events = []
+            for mask, filter in self.from_.iteritems():
+                if new & mask and not old & mask:
+                    events.append(
+                        select.kevent(fd, filter=filter, flags=flags))
+                elif old & mask and not new & mask:
+                    events.append(select.kevent(
+                        fd, filter=filter, flags=select.KQ_EV_DELETE))
+            if events:
+                self.q.control(events, 0)
 
-        def unregister(self, fd, *masks):
-            for mask in masks:
+        def remove(self, fd, old):
+            if fd not in self.oneshot:
+                self.change(fd, old, 0, False)
+                return
+            # a oneshot filter is deleted once it fires, while the others stay
+            # armed, so delete each filter separately
+            for filter in self.from_.itervalues():
                 event = select.kevent(
-                    fd, filter=self.from_[mask], flags=select.KQ_EV_DELETE)
-                self.q.control([event], 0)
+                    fd, filter=filter, flags=select.KQ_EV_DELETE)
+                try:
+                    self.q.control([event], 0)
+                except OSError:
+                    pass
 
-        def poll(self, timeout=None):
+        def harvest(self, timeout=-1):
             if timeout == -1:
                 timeout = None
             while True:
                 try:
-                    events = self.q.control(None, 4, timeout)
+                    events = self.q.control(None, self.maxevents, timeout)
                     break
                 except OSError, err:
                     if err.errno == errno.EINTR:
                         continue
                     raise
 
-            ret = []
+            fds, masks = self.fds, self.masks
+            del fds[:], masks[:]
             for e in events:
                 if e.filter == select.KQ_FILTER_READ and e.data:
-                    ret.append((e.ident, POLLIN))
+                    fds.append(e.ident)
+                    masks.append(POLLIN)
                 if e.filter == select.KQ_FILTER_WRITE:
-                    ret.append((e.ident, POLLOUT))
+                    fds.append(e.ident)
+                    masks.append(POLLOUT)
                 if e.flags & (select.KQ_EV_EOF | select.KQ_EV_ERROR):
-                    ret.append((e.ident, POLLERR))
-            return ret
+                    fds.append(e.ident)
+                    masks.append(POLLERR)
+            self.fired()
+            return len(fds)
+
+    backends['kqueue'] = Kqueue
 
 
-elif hasattr(select, 'epoll'):
-    class Poll(object):
-        def __init__(self):
+if hasattr(select, 'epoll'):
+    class Epoll(Poller):
+        flags = select.EPOLLET
+
+        def __init__(self, maxevents=1024):
+            super(Epoll, self).__init__(maxevents)
             self.q = select.epoll()
 
             self.to_ = {
@@ -67,24 +207,457 @@ elif hasattr(select, 'epoll'):
 
             self.from_ = dict((v, k) for k, v in self.to_.iteritems())
 
-        def register(self, fd, *masks):
-            masks = [self.from_[x] for x in masks] + [
-                select.EPOLLET, select.EPOLLERR, select.EPOLLHUP]
-            self.q.register(fd, reduce(operator.or_, masks, 0))
+        def events(self, new, oneshot):
+            events = self.flags | select.EPOLLERR | select.EPOLLHUP
+            for mask, event in self.from_.iteritems():
+                if new & mask:
+                    events |= event
+            if oneshot:
+                events |= select.EPOLLONESHOT
+            return events
+
+        def add(self, fd, new, oneshot):
+            self.q.register(fd, self.events(new, oneshot))
+
+        def change(self, fd, old, new, oneshot):
+            # EPOLL_CTL_MOD
+            self.q.modify(fd, self.events(new, oneshot))
 
-        def unregister(self, fd, *masks):
+        def remove(self, fd, old):
             self.q.unregister(fd)
 
-        def poll(self, timeout=-1):
-            events = self.q.poll(timeout=timeout)
-            ret = []
+        def harvest(self, timeout=-1):
+            if timeout > 0:
+                # epoll truncates the timeout to whole milliseconds, which
+                # would have the Hub spin through the last millisecond
+                # before a timer, so round it up instead
+                timeout = (math.ceil(timeout * 1000) + 0.5) / 1000.0
+            fds, masks = self.fds, self.masks
+            del fds[:], masks[:]
+            try:
+                events = self.q.poll(timeout, self.maxevents)
+            except IOError, err:
+                # interrupted by a signal: return to let the Hub run its
+                # handlers
+                if err.errno == errno.EINTR:
+                    return 0
+                raise
             for fd, event in events:
-                for mask in self.to_:
-                    if event & mask:
-                        ret.append((fd, self.to_[mask]))
+                if event & select.EPOLLIN:
+                    fds.append(fd)
+                    masks.append(POLLIN)
+                if event & select.EPOLLOUT:
+                    fds.append(fd)
+                    masks.append(POLLOUT)
                 if event & (select.EPOLLERR | select.EPOLLHUP):
-                    ret.append((fd, POLLERR))
-            return ret
+                    fds.append(fd)
+                    masks.append(POLLERR)
+            self.fired()
+            return len(fds)
+
+    class EpollLevel(Epoll):
+        """
+        epoll, level triggered.
+        """
+        edge = False
+        flags = 0
+
+    backends['epoll'] = Epoll
+    backends['epoll-level'] = EpollLevel
+
+
+if sys.platform.startswith('linux'):
+    SYS_io_uring_setup = 425
+    SYS_io_uring_enter = 426
+
+    IORING_OFF_SQ_RING = 0
+    IORING_OFF_CQ_RING = 0x8000000
+    IORING_OFF_SQES = 0x10000000
+
+    IORING_FEAT_SINGLE_MMAP = 1 << 0
+    IORING_FEAT_EXT_ARG = 1 << 8
+
+    IORING_ENTER_GETEVENTS = 1 << 0
+    IORING_ENTER_EXT_ARG = 1 << 3
+
+    IORING_OP_POLL_ADD = 6
+    IORING_OP_POLL_REMOVE = 7
+    IORING_POLL_ADD_MULTI = 1 << 0
+
+    IORING_CQE_F_MORE = 1 << 1
+
+    class io_sqring_offsets(ctypes.Structure):
+        _fields_ = [
+            ('head', ctypes.c_uint32),
+            ('tail', ctypes.c_uint32),
+            ('ring_mask', ctypes.c_uint32),
+            ('ring_entries', ctypes.c_uint32),
+            ('flags', ctypes.c_uint32),
+            ('dropped', ctypes.c_uint32),
+            ('array', ctypes.c_uint32),
+            ('resv1', ctypes.c_uint32),
+            ('user_addr', ctypes.c_uint64), ]
+
+    class io_cqring_offsets(ctypes.Structure):
+        _fields_ = [
+            ('head', ctypes.c_uint32),
+            ('tail', ctypes.c_uint32),
+            ('ring_mask', ctypes.c_uint32),
+            ('ring_entries', ctypes.c_uint32),
+            ('overflow', ctypes.c_uint32),
+            ('cqes', ctypes.c_uint32),
+            ('flags', ctypes.c_uint32),
+            ('resv1', ctypes.c_uint32),
+            ('user_addr', ctypes.c_uint64), ]
+
+    class io_uring_params(ctypes.Structure):
+        _fields_ = [
+            ('sq_entries', ctypes.c_uint32),
+            ('cq_entries', ctypes.c_uint32),
+            ('flags', ctypes.c_uint32),
+            ('sq_thread_cpu', ctypes.c_uint32),
+            ('sq_thread_idle', ctypes.c_uint32),
+            ('features', ctypes.c_uint32),
+            ('wq_fd', ctypes.c_uint32),
+            ('resv', ctypes.c_uint32 * 3),
+            ('sq_off', io_sqring_offsets),
+            ('cq_off', io_cqring_offsets), ]
+
+    class io_uring_sqe(ctypes.Structure):
+        _fields_ = [
+            ('opcode', ctypes.c_uint8),
+            ('flags', ctypes.c_uint8),
+            ('ioprio', ctypes.c_uint16),
+            ('fd', ctypes.c_int32),
+            ('off', ctypes.c_uint64),
+            ('addr', ctypes.c_uint64),
+            ('len', ctypes.c_uint32),
+            ('op_flags', ctypes.c_uint32),
+            ('user_data', ctypes.c_uint64),
+            ('pad', ctypes.c_uint64 * 3), ]
+
+    class io_uring_cqe(ctypes.Structure):
+        _fields_ = [
+            ('user_data', ctypes.c_uint64),
+            ('res', ctypes.c_int32),
+            ('flags', ctypes.c_uint32), ]
+
+    class io_uring_getevents_arg(ctypes.Structure):
+        _fields_ = [
+            ('sigmask', ctypes.c_uint64),
+            ('sigmask_sz', ctypes.c_uint32),
+            ('pad', ctypes.c_uint32),
+            ('ts', ctypes.c_uint64), ]
+
+    class kernel_timespec(ctypes.Structure):
+        _fields_ = [('tv_sec', ctypes.c_int64), ('tv_nsec', ctypes.c_int64)]
+
+    class Uring(Poller):
+        """
+        An io_uring backend, driven with ctypes. Each registered descriptor
+        has a single multishot, edge triggered poll request which stays armed
+        until it's unregistered, so registering costs no syscall of its own:
+        requests are queued on the submission ring and submitted by the next
+        `poll`. Needs Linux 5.13 or later, OSError is raised otherwise.
+
+        Changing a descriptor's masks replaces its poll request. A oneshot
+        descriptor's request isn't multishot, and isn't replaced once it has
+        completed until the descriptor is rearmed.
+        """
+        def __init__(self, entries=256, maxevents=1024):
+            super(Uring, self).__init__(maxevents)
+            libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+            self.syscall = libc.syscall
+            self.syscall.restype = ctypes.c_long
+
+            params = io_uring_params()
+            fd = self.syscall(
+                ctypes.c_long(SYS_io_uring_setup), ctypes.c_long(entries),
+                ctypes.byref(params))
+            if fd < 0:
+                err = ctypes.get_errno()
+                raise OSError(err, os.strerror(err))
+            self.fd = fd
+
+            if not params.features & IORING_FEAT_EXT_ARG:
+                os.close(fd)
+                raise OSError(errno.ENOSYS, 'io_uring is too old')
+
+            sq_size = params.sq_off.array + params.sq_entries * 4
+            cq_size = params.cq_off.cqes + \
+                params.cq_entries * ctypes.sizeof(io_uring_cqe)
+            if params.features & IORING_FEAT_SINGLE_MMAP:
+                sq_size = cq_size = max(sq_size, cq_size)
+
+            def ring(size, offset):
+                m = mmap.mmap(fd, size, offset=offset)
+                return m, ctypes.addressof(ctypes.c_char.from_buffer(m))
+
+            self.maps = []
+            sq, sq_base = ring(sq_size, IORING_OFF_SQ_RING)
+            self.maps.append(sq)
+            if params.features & IORING_FEAT_SINGLE_MMAP:
+                cq_base = sq_base
+            else:
+                cq, cq_base = ring(cq_size, IORING_OFF_CQ_RING)
+                self.maps.append(cq)
+            sqes, sqes_base = ring(
+                params.sq_entries * ctypes.sizeof(io_uring_sqe),
+                IORING_OFF_SQES)
+            self.maps.append(sqes)
+
+            def u32(base, offset):
+                return ctypes.c_uint32.from_address(base + offset)
+
+            off = params.sq_off
+            self.sq_head = u32(sq_base, off.head)
+            self.sq_tail = u32(sq_base, off.tail)
+            self.sq_mask = u32(sq_base, off.ring_mask).value
+            self.sq_entries = params.sq_entries
+            self.sq_array = (ctypes.c_uint32 * params.sq_entries).from_address(
+                sq_base + off.array)
+            self.sqes = (io_uring_sqe * params.sq_entries).from_address(
+                sqes_base)
+
+            off = params.cq_off
+            self.cq_head = u32(cq_base, off.head)
+            self.cq_tail = u32(cq_base, off.tail)
+            self.cq_mask = u32(cq_base, off.ring_mask).value
+            self.cqes = (io_uring_cqe * params.cq_entries).from_address(
+                cq_base + off.cqes)
+
+            self.ts = kernel_timespec()
+            self.arg = io_uring_getevents_arg(
+                ts=ctypes.addressof(self.ts))
+
+            # each poll request has a token as its user_data. tokens maps live
+            # tokens to their descriptor, so completions for a request which
+            # has since been removed are ignored
+            self.seq = 0
+            self.tokens = {}
+            # fd -> the token of its armed request
+            self.armed = {}
+
+        def submission(self):
+            # returns the next free submission queue entry, cleared
+            tail = self.sq_tail.value
+            if (tail - self.sq_head.value) & 0xffffffff == self.sq_entries:
+                # the ring is full, so submit what's queued to make room
+                self.enter(0, 0)
+            index = tail & self.sq_mask
+            sqe = self.sqes[index]
+            ctypes.memset(ctypes.addressof(sqe), 0, ctypes.sizeof(sqe))
+            self.sq_array[index] = index
+            self.sq_tail.value = (tail + 1) & 0xffffffff
+            return sqe
+
+        def enter(self, min_complete, flags, arg=None, argsz=0):
+            to_submit = (self.sq_tail.value - self.sq_head.value) & 0xffffffff
+            ret = self.syscall(
+                ctypes.c_long(SYS_io_uring_enter), ctypes.c_long(self.fd),
+                ctypes.c_long(to_submit), ctypes.c_long(min_complete),
+                ctypes.c_long(flags), arg, ctypes.c_long(argsz))
+            if ret < 0:
+                err = ctypes.get_errno()
+                # interrupted, timed out, or the completion ring is backed up
+                if err in (
+                        errno.EINTR, errno.ETIME, errno.EBUSY, errno.EAGAIN):
+                    return
+                raise IOError(err, os.strerror(err))
+
+        def arm(self, fd, new, oneshot):
+            events = select.POLLERR | select.POLLHUP
+            if new & POLLIN:
+                events |= select.POLLIN
+            if new & POLLOUT:
+                events |= select.POLLOUT
+            self.seq += 1
+            token = self.seq
+            self.tokens[token] = fd
+            self.armed[fd] = token
+            sqe = self.submission()
+            sqe.opcode = IORING_OP_POLL_ADD
+            sqe.fd = fd
+            if not oneshot:
+                sqe.len = IORING_POLL_ADD_MULTI
+            sqe.op_flags = events
+            sqe.user_data = token
+
+        def disarm(self, fd):
+            token = self.armed.pop(fd, None)
+            if token is None:
+                return
+            del self.tokens[token]
+            sqe = self.submission()
+            sqe.opcode = IORING_OP_POLL_REMOVE
+            sqe.addr = token
+
+        def add(self, fd, new, oneshot):
+            self.arm(fd, new, oneshot)
+
+        def change(self, fd, old, new, oneshot):
+            self.disarm(fd)
+            self.arm(fd, new, oneshot)
+
+        def remove(self, fd, old):
+            self.disarm(fd)
+
+        def reap(self):
+            # collects up to maxevents completions, leaving any others on the
+            # ring for the next harvest
+            fds, masks = self.fds, self.masks
+            head = self.cq_head.value
+            tail = self.cq_tail.value
+            n = self.maxevents
+            while head != tail and n:
+                n -= 1
+                cqe = self.cqes[head & self.cq_mask]
+                token, res, flags = cqe.user_data, cqe.res, cqe.flags
+                head = (head + 1) & 0xffffffff
+
+                fd = self.tokens.get(token)
+                if fd is None:
+                    continue
+
+                if res < 0:
+                    # the request failed, and won't be re-armed
+                    fds.append(fd)
+                    masks.append(POLLERR)
+                    if not flags & IORING_CQE_F_MORE:
+                        del self.tokens[token]
+                        del self.armed[fd]
+                    continue
+
+                if res & select.POLLIN:
+                    fds.append(fd)
+                    masks.append(POLLIN)
+                if res & select.POLLOUT:
+                    fds.append(fd)
+                    masks.append(POLLOUT)
+                if res & (select.POLLERR | select.POLLHUP):
+                    fds.append(fd)
+                    masks.append(POLLERR)
+
+                if not flags & IORING_CQE_F_MORE:
+                    del self.tokens[token]
+                    del self.armed[fd]
+                    if fd not in self.oneshot:
+                        # the request is no longer armed, e.g. the
+                        # completion ring overflowed, so re-arm it
+                        self.arm(fd, self.interest[fd], False)
+
+            self.cq_head.value = head
+
+        def harvest(self, timeout=-1):
+            del self.fds[:], self.masks[:]
+            self.reap()
+            if self.fds or timeout == 0:
+                if self.sq_tail.value != self.sq_head.value:
+                    self.enter(0, 0)
+                    self.reap()
+                self.fired()
+                return len(self.fds)
+
+            if timeout is None or timeout < 0:
+                self.enter(1, IORING_ENTER_GETEVENTS)
+            else:
+                frac, whole = math.modf(timeout)
+                self.ts.tv_sec = int(whole)
+                self.ts.tv_nsec = int(frac * 1e9)
+                self.enter(
+                    1, IORING_ENTER_GETEVENTS | IORING_ENTER_EXT_ARG,
+                    ctypes.byref(self.arg), ctypes.sizeof(self.arg))
+            self.reap()
+            self.fired()
+            return len(self.fds)
+
+        def close(self):
+            for m in self.maps:
+                m.close()
+            self.maps = []
+            os.close(self.fd)
+
+    backends['uring'] = Uring
+
+
+if hasattr(select, 'poll'):
+    class SelectPoll(Poller):
+        """
+        select.poll, which is level triggered. A fallback for platforms
+        without kqueue or epoll. Oneshot descriptors are taken out of the poll
+        set once they've been reported.
+        """
+        edge = False
+
+        def __init__(self, maxevents=1024):
+            super(SelectPoll, self).__init__(maxevents)
+            self.q = select.poll()
+
+            self.to_ = {
+                select.POLLIN: POLLIN,
+                select.POLLOUT: POLLOUT, }
+
+            self.from_ = dict((v, k) for k, v in self.to_.iteritems())
+
+        def add(self, fd, new, oneshot):
+            events = 0
+            for mask, event in self.from_.iteritems():
+                if new & mask:
+                    events |= event
+            # registering an fd which is already registered modifies it
+            self.q.register(fd, events)
+
+        def change(self, fd, old, new, oneshot):
+            self.add(fd, new, oneshot)
+
+        def remove(self, fd, old):
+            # a disarmed oneshot fd has already been taken out
+            if fd not in self.disarmed:
+                self.q.unregister(fd)
+
+        def harvest(self, timeout=-1):
+            if timeout is not None and timeout >= 0:
+                timeout = int(math.ceil(timeout * 1000))
+            else:
+                timeout = None
+            # select.poll returns every ready descriptor in order, so there's
+            # nothing to gain from maxevents, and leaving the rest for the
+            # next harvest would starve the higher descriptors
+            fds, masks = self.fds, self.masks
+            del fds[:], masks[:]
+            try:
+                events = self.q.poll(timeout)
+            except select.error, err:
+                # interrupted by a signal. on Python 2 this isn't an IOError,
+                # so the Hub's loop wouldn't catch it
+                if err.args[0] == errno.EINTR:
+                    return 0
+                raise
+            for fd, event in events:
+                if event & select.POLLIN:
+                    fds.append(fd)
+                    masks.append(POLLIN)
+                if event & select.POLLOUT:
+                    fds.append(fd)
+                    masks.append(POLLOUT)
+                if event & (select.POLLERR | select.POLLHUP | select.POLLNVAL):
+                    fds.append(fd)
+                    masks.append(POLLERR)
+            if self.oneshot:
+                for fd in set(fds):
+                    if fd in self.oneshot and fd not in self.disarmed:
+                        self.q.unregister(fd)
+                self.fired()
+            return len(fds)
+
+    backends['poll'] = SelectPoll
+
 
+if 'kqueue' in backends:
+    Poll = backends['kqueue']
+elif 'epoll' in backends:
+    Poll = backends['epoll']
+elif 'poll' in backends:
+    Poll = backends['poll']
 else:
-    raise Exception('only epoll or kqueue supported')
+    raise Exception('only epoll, kqueue or poll supported')
@@ -79,8 +79,9 @@ class __plugin__(object):
                 continue
             self.children = [
                 child for child in self.children if child.check_liveness()]
-        self.sigchld.close()
-        self.sigchld = None
+        # clear before closing so a launch during teardown resubscribes
+        sigchld, self.sigchld = self.sigchld, None
+        sigchld.close()
 
     def bootstrap(self, f, *a, **kw):
         import marshal
@@ -13,16 +13,18 @@ class __plugin__(object):
     def start(self):
         assert not self.fd_w
         r, self.fd_w = os.pipe()
-        self.recver = self.hub.io.fd_in(r)
+        recver = self.recver = self.hub.io.fd_in(r)
 
         @self.hub.spawn
         def _():
-            for data in self.recver:
+            for data in recver:
                 for x in data:
                     sig = ord(x)
                     self.mapper[sig].send(sig)
-            self.recver.close()
-            self.fd_w = self.recver = None
+            recver.close()
+            # we may have already been restarted by a new capture
+            if self.recver is recver:
+                self.recver = None
 
     def capture(self, sig):
         if not self.fd_w:
@@ -45,6 +47,7 @@ class __plugin__(object):
         del self.mapper[sig]
         if not self.mapper:
             os.close(self.fd_w)
+            self.fd_w = None
             # give the recv side a chance to close
             self.hub.sleep(0)
 
@@ -0,0 +1,341 @@
+import collections
+import sys
+
+from greenlet import getcurrent
+
+import vanilla.exception
+
+
+class Semaphore(object):
+    """
+    A Semaphore guards a resource which up to *value* green threads can hold
+    at once::
+
+        s = h.semaphore(2)
+
+        with s:
+            # at most 2 green threads get here at a time
+            ...
+
+    Green threads waiting to acquire are parked on a deque. On release, the
+    Semaphore is handed straight to the first waiter, which is switched to
+    directly, so waiters acquire in the order they arrived.
+    """
+    def __init__(self, hub, value=1):
+        assert value >= 0
+        self.hub = hub
+        self.value = value
+        self.waiters = collections.deque()
+
+    def acquire(self, timeout=-1):
+        """
+        Acquires the Semaphore, blocking if need be either forever or until
+        *timeout* milliseconds.
+        """
+        if self.value > 0:
+            self.value -= 1
+            return True
+        current = getcurrent()
+        self.waiters.append(current)
+        try:
+            self.hub.pause(timeout=timeout)
+        except BaseException:
+            if current in self.waiters:
+                self.waiters.remove(current)
+            raise
+        # release handed the Semaphore to us
+        return True
+
+    def release(self):
+        if self.waiters:
+            self.hub.switch_to(self.waiters.popleft())
+            return
+        self.value += 1
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *a):
+        self.release()
+
+
+class Lock(Semaphore):
+    """
+    A Lock is a `Semaphore` which only one green thread can hold at a time.
+    """
+    def __init__(self, hub):
+        super(Lock, self).__init__(hub, 1)
+
+    def locked(self):
+        return self.value == 0
+
+    def release(self):
+        if not self.locked():
+            raise RuntimeError('release unlocked lock')
+        super(Lock, self).release()
+
+
+class Event(object):
+    """
+    An Event is a flag which green threads can wait on to be set::
+
+        e = h.event()
+        h.spawn_later(10, e.set)
+        e.wait() # returns after 10ms
+    """
+    def __init__(self, hub):
+        self.hub = hub
+        self.flag = False
+        self.waiters = collections.deque()
+
+    def is_set(self):
+        return self.flag
+
+    def set(self):
+        """
+        Sets the flag, and queues each of the waiting green threads to be
+        resumed on the Hub's next pass.
+        """
+        self.flag = True
+        waiters, self.waiters = self.waiters, collections.deque()
+        for waiter in waiters:
+            self.hub.wake(waiter)
+
+    def clear(self):
+        self.flag = False
+
+    def wait(self, timeout=-1):
+        """
+        Blocks until the flag is set, either forever or until *timeout*
+        milliseconds.
+        """
+        if self.flag:
+            return True
+        current = getcurrent()
+        self.waiters.append(current)
+        try:
+            self.hub.pause(timeout=timeout)
+        except vanilla.exception.Timeout:
+            if current in self.waiters:
+                self.waiters.remove(current)
+                raise
+            # we were woken just as we timed out, so take the queued wake up
+            # and carry on as woken
+            self.hub.pause()
+        except BaseException:
+            if current in self.waiters:
+                self.waiters.remove(current)
+            else:
+                self.hub.pause()
+            raise
+        return True
+
+
+class Condition(object):
+    """
+    A Condition lets green threads holding *lock* wait to be notified::
+
+        c = h.condition()
+
+        with c:
+            while not ready():
+                c.wait()
+
+    *lock* defaults to a new `Lock`. Notified waiters are moved straight on
+    to the lock's waiters, rather than being woken just to block on the lock
+    again, so the lock is handed to them in turn as it's released.
+    """
+    def __init__(self, hub, lock=None):
+        self.hub = hub
+        self.lock = lock if lock is not None else Lock(hub)
+        self.waiters = collections.deque()
+
+    def acquire(self, timeout=-1):
+        return self.lock.acquire(timeout=timeout)
+
+    def release(self):
+        self.lock.release()
+
+    def __enter__(self):
+        self.lock.acquire()
+        return self
+
+    def __exit__(self, *a):
+        self.lock.release()
+
+    def wait(self, timeout=-1):
+        """
+        Releases the lock and blocks until notified, either forever or until
+        *timeout* milliseconds. The lock is held again when wait returns,
+        including when it raises. Only the wait to be notified is timed: once
+        notified, wait returns as soon as the lock is handed back, however
+        long that takes.
+        """
+        current = getcurrent()
+        self.waiters.append(current)
+        self.lock.release()
+        try:
+            self.hub.pause(timeout=timeout)
+        except vanilla.exception.Timeout:
+            if current in self.waiters:
+                self.waiters.remove(current)
+                self.lock.acquire()
+                raise
+            # notified before we timed out, so stay in line for the lock
+            if current in self.lock.waiters:
+                self.hub.pause()
+        except BaseException:
+            if current in self.waiters:
+                self.waiters.remove(current)
+                self.lock.acquire()
+            elif current in self.lock.waiters:
+                self.lock.waiters.remove(current)
+                self.lock.acquire()
+            # otherwise the lock was handed to us as we were interrupted
+            raise
+        return True
+
+    def notify(self, n=1):
+        """
+        Wakes up to *n* waiters, which hold the lock again in turn once it's
+        released. The caller must hold the lock, RuntimeError is raised
+        otherwise.
+        """
+        if not self.lock.locked():
+            raise RuntimeError('notify on un-acquired lock')
+        while self.waiters and n:
+            self.lock.waiters.append(self.waiters.popleft())
+            n -= 1
+
+    def notify_all(self):
+        self.notify(len(self.waiters))
+
+
+class Task(object):
+    """
+    A handle to a callable spawned with `Hub.go`, which can be used to wait
+    for its result::
+
+        task = h.go(fetch, url)
+        ...
+        body = task.result(timeout=1000)
+
+    No `Pipe`_ is involved: the task's green thread wakes its waiters
+    directly when it finishes.
+
+    If the task raises and its exception is never retrieved with `result`,
+    the exception is logged once the task is garbage collected.
+    """
+    def __init__(self, hub, f, a, kw):
+        self.hub = hub
+        self.f = f
+        self.a = a
+        self.kw = kw
+        self.greenlet = None
+        self.finished = False
+        self.value = None
+        self.exception = None
+        self.exc_info = None
+        self.unretrieved = None
+        self.callbacks = []
+
+    def run(self):
+        if self.finished:
+            # cancelled before it started
+            return
+        self.greenlet = getcurrent()
+        try:
+            value = self.f(*self.a, **self.kw)
+        except Exception:
+            self.finish(None, sys.exc_info())
+        else:
+            self.finish(value, None)
+        # the frames of a stored traceback lead back to this one, so let go
+        # of the task rather than tie it in a cycle
+        del self
+
+    def finish(self, value, exc_info):
+        self.finished = True
+        self.value = value
+        if exc_info is not None:
+            self.exc_info = exc_info
+            self.exception = exc_info[1]
+            if not self.cancelled():
+                self.unretrieved = Unretrieved(self.hub.log, exc_info)
+        self.greenlet = self.f = self.a = self.kw = None
+        callbacks, self.callbacks = self.callbacks, []
+        for f, a, kw in callbacks:
+            f(*a, **kw)
+
+    def done(self):
+        return self.finished
+
+    def cancelled(self):
+        return isinstance(self.exception, vanilla.exception.Cancelled)
+
+    def ondone(self, f, *a, **kw):
+        """
+        Calls *f(\*a, \*\*kw)* once the task has finished, or straight away
+        if it already has.
+        """
+        if self.finished:
+            f(*a, **kw)
+            return None
+        callback = (f, a, kw)
+        self.callbacks.append(callback)
+        return callback
+
+    def cancel(self):
+        """
+        Cancels the task. A task which hasn't started yet won't be run. A
+        running task has Cancelled thrown into it where it's blocked. Returns
+        False if the task has already finished.
+        """
+        if self.finished:
+            return False
+        if self.greenlet is None:
+            e = vanilla.exception.Cancelled('cancelled')
+            self.finish(None, (type(e), e, None))
+            return True
+        if self.greenlet is getcurrent():
+            raise vanilla.exception.Cancelled('cancelled')
+        self.hub.throw_to(
+            self.greenlet, vanilla.exception.Cancelled('cancelled'))
+        return True
+
+    def result(self, timeout=-1):
+        """
+        Returns the task's result, blocking until it has finished, either
+        forever or until *timeout* milliseconds. If the task raised, the
+        exception is raised here instead.
+        """
+        if not self.finished:
+            self.hub.wait_all([self], timeout=timeout)
+        if self.exc_info is not None:
+            if self.unretrieved is not None:
+                self.unretrieved.exc_info = None
+                self.unretrieved = None
+            typ, val, tb = self.exc_info
+            raise typ, val, tb
+        return self.value
+
+
+class Unretrieved(object):
+    """
+    Logs the exception a `Task` raised if it's collected without having been
+    retrieved. It's held by the Task, but holds no reference back, so it can
+    have a __del__ without keeping the Task from being collected.
+    """
+    __slots__ = ('log', 'exc_info')
+
+    def __init__(self, log, exc_info):
+        self.log = log
+        self.exc_info = exc_info
+
+    def __del__(self):
+        if self.exc_info is None:
+            # retrieved
+            return
+        self.log.warn(
+            'Exception leaked from unretrieved task', exc_info=self.exc_info)
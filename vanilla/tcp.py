@@ -9,28 +9,40 @@ class __plugin__(object):
     def __init__(self, hub):
         self.hub = hub
 
-    def listen(self, port=0, host='127.0.0.1'):
+    def listen(self, port=0, host='127.0.0.1', oneshot=False):
+        """
+        Listens on *host*:*port* and returns a `Recver`_ of connections.
+        *port* defaults to a free port, which is available as *port* on the
+        returned Recver. Pass *oneshot* as True if the listening socket is
+        shared with other Hubs, see `Hub.watch`.
+        """
         sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         sock.bind((host, port))
         sock.listen(socket.SOMAXCONN)
         sock.setblocking(0)
         port = sock.getsockname()[1]
-        server = self.hub.register(sock.fileno(), vanilla.poll.POLLIN)
+        watch = self.hub.watch(
+            sock.fileno(), vanilla.poll.POLLIN, oneshot=oneshot)
 
-        @server.pipe
-        def server(upstream, downstream):
-            for mask in upstream:
+        @self.hub.producer
+        def server(downstream):
+            try:
                 while True:
-                    try:
-                        conn, host = sock.accept()
+                    watch.wait(vanilla.poll.POLLIN)
+                    while True:
+                        try:
+                            conn, host = sock.accept()
+                        except (socket.error, OSError), e:
+                            if e.errno == errno.EAGAIN:
+                                break
+                            raise
                         downstream.send(self.hub.io.socket(conn))
-                    except (socket.error, OSError), e:
-                        if e.errno == errno.EAGAIN:
-                            break
-                        raise
+            except vanilla.exception.Halt:
+                pass
             self.hub.unregister(sock.fileno())
             sock.close()
+            downstream.close()
 
         server.port = port
         return server
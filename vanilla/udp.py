@@ -3,6 +3,7 @@ import socket
 import errno
 import os
 
+import vanilla.exception
 import vanilla.message
 import vanilla.poll
 
@@ -53,8 +54,13 @@ def Recver(hub, sock):
 
     @hub.spawn
     def _():
-        ready = hub.register(sock.fileno(), vanilla.poll.POLLIN)
-        for _ in ready:
+        watch = hub.watch(sock.fileno(), vanilla.poll.POLLIN)
+        while True:
+            try:
+                watch.wait(vanilla.poll.POLLIN)
+            except vanilla.exception.Halt:
+                break
+
             while True:
                 try:
                     got = sock.recvfrom(65507)
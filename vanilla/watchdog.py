@@ -0,0 +1,239 @@
+from __future__ import absolute_import
+
+import traceback
+import threading
+import logging
+import sys
+
+from greenlet import getcurrent
+import greenlet
+
+import vanilla.core
+
+
+log = logging.getLogger(__name__)
+
+
+RUN = vanilla.core.Workers.run.__func__.__code__
+
+
+def describe(frame):
+    """
+    Returns the name of the task which owns *frame* and its formatted stack.
+    For a task running on a pooled worker, the name is the task's function
+    rather than the worker's, or None if the worker's task has finished.
+    """
+    work = vanilla.core.Workers.work.__func__.__code__
+    stack = traceback.extract_stack(frame)
+    name = stack and stack[0][2] or None
+    inner = None
+    while frame is not None:
+        if frame.f_code is work:
+            name = inner and inner.f_code.co_name
+            break
+        inner, frame = frame, frame.f_back
+    return name, traceback.format_list(stack)
+
+
+class Tracer(object):
+    """
+    greenlet has a single trace hook per thread, so rather than each watchdog
+    installing its own, the first watchdog started on a thread installs a
+    Tracer, which passes switches on to every watchdog running on the thread
+    and to whatever hook was installed before it.
+
+    Once the last watchdog stops, the Tracer is uninstalled, unless another
+    hook has been installed over it in the meantime. It's then left in place
+    so as not to drop that hook, and just passes switches on.
+    """
+    local = threading.local()
+
+    @classmethod
+    def get(cls):
+        tracer = getattr(cls.local, 'tracer', None)
+        if tracer is None:
+            tracer = cls.local.tracer = cls()
+        return tracer
+
+    def __init__(self):
+        self.watchdogs = []
+        self.previous = None
+        self.installed = False
+
+    def add(self, watchdog):
+        self.watchdogs.append(watchdog)
+        if not self.installed:
+            self.previous = greenlet.settrace(self)
+            self.installed = True
+
+    def remove(self, watchdog):
+        self.watchdogs.remove(watchdog)
+        if not self.watchdogs and greenlet.gettrace() is self:
+            greenlet.settrace(self.previous)
+            self.previous = None
+            self.installed = False
+
+    def __call__(self, event, args):
+        if self.previous is not None:
+            self.previous(event, args)
+        for watchdog in self.watchdogs:
+            watchdog.trace(event, args)
+
+
+class __plugin__(object):
+    """
+    An opt-in watchdog which reports green threads that hold the Hub's loop
+    for longer than a threshold::
+
+        h.watchdog.start(threshold=50)
+
+    Every switch to or from one of the Hub's green threads is timed with
+    greenlet's trace hook, see `Tracer`. When a green thread switches away
+    after running for more than *threshold* milliseconds it's reported. A
+    helper thread also samples, every *interval* milliseconds, how long the
+    green thread running now has been running since it was switched to. So a
+    green thread which never yields is reported while it's still running,
+    with its stack at the time, see `sample`. *interval* defaults to half the
+    threshold, and 0 disables the helper thread.
+
+    The helper thread also reports a loop which doesn't get back to polling
+    for more than *threshold* milliseconds, even if no one green thread held
+    it for that long, e.g. a turn of many short tasks, or green threads
+    which keep each other ready. These are reported with the name 'loop'.
+
+    Reports are passed to *callback(name, ms, stack)*, which defaults to
+    logging a warning. Note the helper thread's reports are made from the
+    helper thread.
+    """
+    def __init__(self, hub):
+        self.hub = hub
+        self.clock = hub.clock
+        self.running = False
+
+    def start(self, threshold=100, callback=None, interval=None):
+        assert not self.running
+        self.running = True
+        self.threshold = threshold / 1000.0
+        self.callback = callback or self.report
+        self.ident = threading.current_thread().ident
+
+        self.since = self.clock()
+        self.started = None
+        self.reported = None
+        self.current = getcurrent()
+        # the last time the loop was seen polling, see sample
+        self.polls = self.hub.polls
+        self.polled = self.since
+        self.stalled = None
+        Tracer.get().add(self)
+
+        if interval is None:
+            interval = threshold / 2.0
+        self.thread = None
+        if interval:
+            self.done = threading.Event()
+            self.thread = threading.Thread(
+                target=self.check, args=(interval / 1000.0,))
+            self.thread.daemon = True
+            self.thread.start()
+
+    def stop(self):
+        if not self.running:
+            return
+        self.running = False
+        Tracer.get().remove(self)
+        if self.thread is not None:
+            self.done.set()
+            self.thread.join()
+            self.thread = None
+
+    def report(self, name, ms, stack):
+        log.warning(
+            '%s held the loop for %.1fms\n%s', name, ms, ''.join(stack))
+
+    def owns(self, g):
+        # whether the green thread *g* belongs to our Hub: its loop, or a
+        # green thread started from it
+        loop = self.hub.loop
+        while g is not None:
+            if g is loop:
+                return True
+            g = g.parent
+        return False
+
+    def trace(self, event, args):
+        if event not in ('switch', 'throw'):
+            return
+        origin, target = args
+        now = self.clock()
+        elapsed, self.since = now - self.since, now
+        if not self.owns(origin) and not self.owns(target):
+            # a switch on another Hub sharing our thread: whatever runs next
+            # isn't ours to time
+            self.current = None
+            return
+        started, self.started = self.started, None
+        self.current = target
+
+        # the trace hook runs once we're on the target's stack, so the origin
+        # is suspended and its frames can be inspected
+        if origin is self.hub.loop:
+            # note the task the loop is handing to a worker, as its frames are
+            # gone by the time the worker switches back
+            frame = origin.gr_frame
+            if frame is not None and frame.f_code is RUN:
+                self.started = frame.f_locals.get('task')
+            return
+
+        if elapsed < self.threshold:
+            return
+        name, stack = describe(origin.gr_frame)
+        if name is None:
+            name = getattr(started, '__name__', repr(started))
+        self.callback(name, elapsed * 1000, stack)
+
+    def sample(self):
+        """
+        Reports the green thread running on the Hub's thread if it's been
+        running for longer than the threshold since it was switched to. Each
+        run of a green thread is only reported once. A green thread of
+        another Hub sharing our thread isn't reported.
+
+        Then reports the loop if it hasn't polled for longer than the
+        threshold, unless that's down to the green thread just reported. The
+        loop's polls are counted rather than timed by the Hub, so when it
+        last polled is only known to within a sample, but it's timed by our
+        clock. Each stretch without a poll is only reported once.
+        """
+        now = self.clock()
+        since = self.since
+        current = self.current
+        if since != self.reported and current is not None and \
+                current is not self.hub.loop and \
+                now - since >= self.threshold:
+            frame = sys._current_frames().get(self.ident)
+            if frame is not None:
+                self.reported = since
+                name, stack = describe(frame)
+                self.callback(name, (now - since) * 1000, stack)
+
+        polls = self.hub.polls
+        if self.hub.polling or polls != self.polls:
+            self.polls = polls
+            self.polled = now
+            return
+        polled = self.polled
+        if polled == self.stalled or current is None or \
+                self.reported == since or now - polled < self.threshold:
+            return
+        frame = sys._current_frames().get(self.ident)
+        if frame is None:
+            return
+        self.stalled = polled
+        name, stack = describe(frame)
+        self.callback('loop', (now - polled) * 1000, stack)
+
+    def check(self, interval):
+        # the helper thread
+        while not self.done.wait(interval):
+            self.sample()